@@ -8,14 +8,17 @@ from bokeh.palettes import RdYlBu3
 from random import random
 from functools import partial
 from collections import deque
+from concurrent.futures import ThreadPoolExecutor
 from pcdsdevices import beam_stats
-from auto_monochromator.rapid_stats import RapidHist, RapidTransmissionHist
-from auto_monochromator.event_builder import basic_event_builder
+from auto_monochromator.rapid_stats import (RapidHist, RapidTransmissionHist,
+    RapidTimeHist, RapidTimeTransmissionHist)
+from auto_monochromator.event_builder import StreamingEventBuilder
+from auto_monochromator.staging import StagingBuffer
 import numpy as np
 from tornado.ioloop import PeriodicCallback
 import time
-import pandas as pd
 import socket
+import os
 import logging
 # logging.basicConfig(level=logging.DEBUG)
 logger = logging.getLogger(__name__)
@@ -49,7 +52,9 @@ def single_plot(doc,plot_data,y_range=(-50,500)):
     def callback(count_obj, hist_data):
         count_obj.i += 1
         new_hist_data = dict()
-        new_hist_data['top'] = hist_data.hs
+        # The data source keeps the array it is given, and hs is reused by
+        # later updates, so hand it a copy
+        new_hist_data['top'] = np.array(hist_data.hs)
         new_hist_data['bottom'] = np.zeros(len(hist_data.hs))
         new_hist_data['left'] = hist_data.bins[:-1]
         new_hist_data['right'] = hist_data.bins[1:]
@@ -87,58 +92,122 @@ class plot_package:
         pass 
 
 
-def produce_single_hist(data_source, hist, out):
+def produce_single_hist(data_source, hist, out, timed=False):
     """
-    Pull Data from the data source (ds), clear the data source, push the data
-    into the hist, and generate the hist.
+    Drain the data from the data source, push the data into the hist, and
+    generate the hist. If timed is set, the data source holds value and
+    timestamp pairs which are pushed together into a time windowed hist.
     """
-    logging.debug('produce_single_hist '+str(len(data_source)))
-    hist.push(data_source)
-    data_source.clear()
-    out.hs, out.bins = hist.hist()
-
-def produce_ts_hist(ds_inc, ds_inc_t, ds_out, ds_out_t, hist, out):
+    if timed:
+        values, timestamps = data_source.drain()
+        hist.push(values, timestamps)
+    else:
+        values, = data_source.drain()
+        hist.push(values)
+    logger.debug('produce_single_hist {}'.format(len(values)))
+    hs, = out.buffers(hist.binning.nbins, 1)
+    out.hs, out.bins = hist.hist(out=hs)
+
+def produce_ts_hist(ds_inc, ds_out, builder, hist, out, timed=False):
     """
-    Pull Data from the data source (ds), clear the data source, push the data
-    into the hist, and generate the hist.
+    Drain the value and timestamp pairs from the data sources (ds), match
+    them into events with the builder, push the events into the hist, and
+    generate the hist. Samples whose partner has not arrived yet are held by
+    the builder for a later update. If timed is set, the event timestamps
+    are pushed alongside the data for time windowed hists.
     """
-    logger.debug('produce_ts_hist {} {} {} {} {}'.format(time.ctime(),
-                len(ds_inc), len(ds_inc_t), len(ds_out), len(ds_out_t)))
-    data = pd.Series(ds_inc,index=ds_inc_t)
-    weights = pd.Series(ds_out,index=ds_out_t)
-    zipped = basic_event_builder(data=data,weights=weights)
-    hist.push(zipped['data'],zipped['weights'])
-    ds_inc.clear()
-    ds_inc_t.clear()
-    ds_out.clear()
-    ds_out_t.clear()
-    _, _, out.hs, out.bins = hist.hist()
-
-    # using try except doesn't because pandas prevents numpy from throwing
-    # errors (it even overwrites np.seterr). For more details, see 
-    # https://github.com/pandas-dev/pandas/issues/12464 
-    if np.all(out.hs == 0):
-        out.hs = np.zeros(len(out.bins)-1)
-    
+    inc, inc_t = ds_inc.drain()
+    outgoing, outgoing_t = ds_out.drain()
+    logger.debug('produce_ts_hist {} {} {}'.format(time.ctime(),
+                len(inc), len(outgoing)))
+    builder.push('data', inc, inc_t)
+    builder.push('weights', outgoing, outgoing_t)
+    timestamps, events = builder.build()
+    logger.debug('produce_ts_hist matched {events} dropped {expired} '
+                 'late {late} match rate {match_rate:.2f}'.format(
+                     **builder.batch_stats))
+    if timed:
+        hist.push(events['data'], events['weights'], timestamps)
+    else:
+        hist.push(events['data'], events['weights'])
+    # The ratio is divided in place only where there are counts, so empty
+    # bins come back as zeros rather than nan
+    _, _, out.hs, out.bins = hist.hist(out=out.buffers(hist.binning.nbins, 3))
 
 
 class Carrier:
     def __init__(self):
         self.hs = None
         self.bins = None
-    
+        # Reusable result arrays, overwritten in place on every update, so
+        # readers keeping hs beyond a callback must copy it
+        self._buffers = None
+
+    def buffers(self, size, count):
+        """
+        Return the set of count reusable float arrays of length size.
+        """
+        if self._buffers is None or len(self._buffers[0]) != size:
+            self._buffers = tuple(np.zeros(size) for _ in range(count))
+        return self._buffers
+
+
+def restore_checkpoint(hist, path):
+    """
+    Load the hist from the checkpoint at path, if there is one.
+    """
+    if not os.path.exists(path):
+        return
+    try:
+        hist.restore(path)
+    except Exception:
+        logger.exception('Unable to restore checkpoint {}'.format(path))
+    else:
+        logger.info('Restored {} samples from {}'.format(len(hist.data), path))
+
+def write_checkpoint(arrays, path):
+    """
+    Write checkpoint arrays to path. The file is replaced in one step so an
+    interrupted write never leaves a truncated checkpoint behind.
+    """
+    partial_path = path + '.partial'
+    try:
+        with open(partial_path, 'wb') as f:
+            np.savez(f, **arrays)
+        os.replace(partial_path, path)
+    except Exception:
+        logger.exception('Unable to write checkpoint {}'.format(path))
+
+def checkpoint_hists(hists, executor):
+    """
+    Copy the state of the hists on the loop and write them out in the
+    background.
+
+    Parameters
+    ----------
+    hists : iterable of (RapidHist, str)
+        Hists and the paths of their checkpoints.
+
+    executor : concurrent.futures.Executor
+        Executor running the writes.
+    """
+    for hist, path in hists:
+        executor.submit(write_checkpoint, hist.checkpoint(), path)
+
 def append_to_data_block(*args,**kwargs):
-    kwargs['inc_data_block'].append(kwargs['value'])
+    kwargs['inc_data_block'].put(kwargs['value'])
 
 def append_to_data_block_t(*args,**kwargs):
-    kwargs['inc_value'].append(kwargs['value'])
-    kwargs['inc_time'].append(kwargs['timestamp'])
+    # Stage value and timestamp as one record so they can't be separated
+    kwargs['inc_data_block'].put(kwargs['value'], kwargs['timestamp'])
 
 # Setting num_procs here means we can't touch the IOLoop before now, we must
 # let Server handle that. If you need to explicitly handle IOLoops then you
 # will need to use the lower level BaseServer class.
 def launch_server(in_ophyd,out_ophyd,port=5006,maxlen=1000,
-            bins=np.arange(9450,9550,1), public=False):
+            bins=np.arange(9450,9550,1), public=False, horizon=None,
+            checkpoint=None, checkpoint_interval=60, match_horizon=1.0,
+            match_tolerance=0, match_lateness=None):
     '''
     Launch a bokeh_server providing the histograms of incident and transmitted
     energy in a web page.
@@ -165,13 +234,14 @@ def launch_server(in_ophyd,out_ophyd,port=5006,maxlen=1000,
         taking into consideration the data output rate of the in_ophyd and
         out_ophyd PVs. 
 
-    bins : int, sequence of scalars
+    bins : int, sequence of scalars or Binning
         This specifies the binning scheme of the histograms. This argument
         behaves much like the `numpy.histogram's bins
         <https://docs.scipy.org/doc/numpy/reference/generated/numpy.histogram.html>`_
         argument. A single value can be picked and the method can attempt to
         guess the range or the regions of each bin can be specified precisely
-        with a sequential object.
+        with a sequential object. Evenly spaced edges, such as those made by
+        numpy.arange, are detected and binned arithmetically.
 
     public : bool, optional
         By default, bokeh servers do not allow connections from any ip address
@@ -179,23 +249,68 @@ def launch_server(in_ophyd,out_ophyd,port=5006,maxlen=1000,
         plots on one machine such that they can be viewed from a web-browser on
         another machine.
 
-
+    horizon : float, optional
+        If given, the histograms cover the samples of the last horizon
+        seconds instead of the last maxlen samples, so the plots span the same
+        time whatever the beam rate. Maxlen then only caps the memory used.
+        Shots are then built in time order, with match_lateness defaulting
+        to match_horizon.
+
+    checkpoint : str, optional
+        Directory to keep checkpoints of the histograms in. If given, the
+        histograms are reloaded from it on startup, so the plots are useful
+        straight after a restart, and saved to it every checkpoint_interval
+        seconds.
+
+    checkpoint_interval : float, optional
+        Seconds between checkpoints.
+
+    match_horizon : float, optional
+        Seconds to hold incident and transmitted samples waiting for the
+        sample with the same timestamp on the other PV.
+
+    match_tolerance : float, optional
+        Largest difference in seconds between the timestamps of an incident
+        and a transmitted sample paired into one shot. By default only equal
+        timestamps are paired.
+
+    match_lateness : float, optional
+        Seconds a PV may lag the other one. If given, shots are only built
+        once both PVs have advanced past them, and samples arriving later
+        than this are counted and dropped. By default shots are built as
+        soon as both samples have arrived, unless horizon is given.
     '''
+    if horizon is not None and match_lateness is None:
+        # Time windows drop shots built out of order, so build them in order
+        match_lateness = match_horizon
     
     # Acquire EPICS umata and generate plot for Accelerator reported energy
-    # Store inbound data in this deque
-    accel_ev_data_block = deque(maxlen=maxlen)
-    # Attach this method to the PV to aggregate data in the deque
-    
-    #stats.accel_ev.subscribe(
-    in_ophyd.subscribe(
-        partial(append_to_data_block, inc_data_block=accel_ev_data_block)
-    )
-    # Define the histogram to be plotted
-    accel_ev_hist = RapidHist(
+    # Stage inbound data from the Channel Access thread in this buffer
+    accel_ev_data_block = StagingBuffer(
         maxlen=maxlen,
-        bins = bins,
+        fields=1 if horizon is None else 2,
     )
+    # Attach this method to the PV to aggregate data in the buffer
+    
+    #stats.accel_ev.subscribe(
+    if horizon is None:
+        in_ophyd.subscribe(
+            partial(append_to_data_block, inc_data_block=accel_ev_data_block)
+        )
+        # Define the histogram to be plotted
+        accel_ev_hist = RapidHist(
+            maxlen=maxlen,
+            bins = bins,
+        )
+    else:
+        in_ophyd.subscribe(
+            partial(append_to_data_block_t, inc_data_block=accel_ev_data_block)
+        )
+        accel_ev_hist = RapidTimeHist(
+            horizon=horizon,
+            maxlen=maxlen,
+            bins = bins,
+        )
     # Create object for sending histogram data to draw method
     accel_ev_carry = Carrier()
     # Schedule the data-acquiring and regeneration of the histogram
@@ -204,33 +319,47 @@ def launch_server(in_ophyd,out_ophyd,port=5006,maxlen=1000,
             produce_single_hist, 
             data_source=accel_ev_data_block, 
             hist=accel_ev_hist,
-            out=accel_ev_carry
+            out=accel_ev_carry,
+            timed=horizon is not None,
         ),
         500
     )
 
     # Acquire EPICS data and generate plot for Transmission plots
-    # Store inbound data in this deque
-    t_accel_db = deque(maxlen=maxlen)
-    t_accel_db_time = deque(maxlen=maxlen)
-    t_gmd_db = deque(maxlen=maxlen)
-    t_gmd_db_time = deque(maxlen=maxlen)
-    # Attach this method to the PV to aggregate data in the deque
+    # Stage inbound value and timestamp pairs in these buffers
+    t_accel_db = StagingBuffer(maxlen=maxlen, fields=2)
+    t_gmd_db = StagingBuffer(maxlen=maxlen, fields=2)
+    # Attach this method to the PV to aggregate data in the buffer
     
     
     #stats.accel_ev.subscribe(
     in_ophyd.subscribe(
-        partial(append_to_data_block_t,inc_value=t_accel_db,inc_time=t_accel_db_time)
+        partial(append_to_data_block_t,inc_data_block=t_accel_db)
     )
     #stats.xpp_ipm2.subscribe(
     
     out_ophyd.subscribe(
-        partial(append_to_data_block_t,inc_value=t_gmd_db,inc_time=t_gmd_db_time)
+        partial(append_to_data_block_t,inc_data_block=t_gmd_db)
     )
     # Define the histogram to be plotted
-    t_hist = RapidTransmissionHist(
+    if horizon is None:
+        t_hist = RapidTransmissionHist(
+            maxlen=maxlen,
+            bins = bins,
+        )
+    else:
+        t_hist = RapidTimeTransmissionHist(
+            horizon=horizon,
+            maxlen=maxlen,
+            bins = bins,
+        )
+    # Match the incident and transmitted samples into events
+    t_builder = StreamingEventBuilder(
+        ('data', 'weights'),
+        horizon=match_horizon,
         maxlen=maxlen,
-        bins = bins,
+        tolerance=match_tolerance,
+        lateness=match_lateness,
     )
     # Create object for sending histogram data to draw method
     t_carry = Carrier()
@@ -239,14 +368,33 @@ def launch_server(in_ophyd,out_ophyd,port=5006,maxlen=1000,
         partial(
             produce_ts_hist,
             ds_inc=t_accel_db,
-            ds_inc_t=t_accel_db_time,
             ds_out=t_gmd_db, 
-            ds_out_t=t_gmd_db_time,
+            builder=t_builder,
             hist=t_hist,
-            out=t_carry),
+            out=t_carry,
+            timed=horizon is not None),
         500
     )
 
+    # Reload the histograms from the last run and keep checkpointing them
+    checkpoint_call = None
+    if checkpoint is not None:
+        os.makedirs(checkpoint, exist_ok=True)
+        checkpoints = [
+            (accel_ev_hist, os.path.join(checkpoint, 'incident.npz')),
+            (t_hist, os.path.join(checkpoint, 'transmission.npz')),
+        ]
+        for hist, path in checkpoints:
+            restore_checkpoint(hist, path)
+        checkpoint_call = PeriodicCallback(
+            partial(
+                checkpoint_hists,
+                hists=checkpoints,
+                executor=ThreadPoolExecutor(max_workers=1),
+            ),
+            checkpoint_interval * 1000
+        )
+
     origins = ["localhost:{}".format(port)]
     if public:
         origins.append('{}:{}'.format(
@@ -286,6 +434,8 @@ def launch_server(in_ophyd,out_ophyd,port=5006,maxlen=1000,
     
     accel_ev_call.start()
     t_call.start() 
+    if checkpoint_call is not None:
+        checkpoint_call.start()
     # Use the following command to automatically start a browser
     # server.io_loop.add_callback(server.show, "/")
 
@@ -7,10 +7,456 @@ def basic_event_builder(*args,**kwargs):
     Pass any number of pandas Series and return an event built pandas
     DataFrame.  Kwargs can be used to name the columns of the returned
     DataFrame.
+
+    Only the timestamps present in every Series, with a value in each,
+    become rows. The Series are joined with multi_join, so the cost does not
+    depend on the union of their timestamps.
     """
     data_table = dict()
     [data_table.setdefault(col,args[col]) for col in range(len(args))]
     [data_table.setdefault(col,kwargs[col]) for col in kwargs]
-    full_frame = pd.DataFrame(data_table)
+    series = [
+        data.sort_index() if not data.index.is_monotonic_increasing else data
+        for data in data_table.values()
+    ]
+    indices = multi_join(*(data.index.values for data in series))
+    columns = {
+        col: data.values[index]
+        for col, data, index in zip(data_table, series, indices)
+    }
+    index = series[0].index[indices[0]] if series else None
+    full_frame = pd.DataFrame(columns, index=index, columns=list(data_table))
     return full_frame.dropna()
 
+
+
+def merge_join(left, right):
+    """
+    Match the samples of two streams with equal timestamps.
+
+    Both streams must be sorted by timestamp, which lets every sample be
+    looked up with a binary search on plain arrays instead of aligning
+    pandas indexes. Each timestamp is matched at most once: repeats of a
+    timestamp within a stream after the first are left unmatched.
+
+    Parameters
+    ----------
+    left : numpy.ndarray
+        Sorted timestamps of the first stream.
+
+    right : numpy.ndarray
+        Sorted timestamps of the second stream.
+
+    Returns
+    -------
+    left_indices : numpy.ndarray
+        Index in left of each match, in increasing order.
+
+    right_indices : numpy.ndarray
+        Index in right of each match.
+    """
+    left = np.asarray(left)
+    right = np.asarray(right)
+    candidates = np.ones(len(left), dtype=bool)
+    candidates[1:] = left[1:] != left[:-1]
+    left_indices = np.flatnonzero(candidates)
+    right_indices = np.searchsorted(right, left[left_indices], side='left')
+    found = right_indices < len(right)
+    found[found] = right[right_indices[found]] == left[left_indices[found]]
+    return left_indices[found], right_indices[found]
+
+
+def nearest_join(left, right, tolerance, direction='nearest'):
+    """
+    Match the samples of two streams with timestamps within a tolerance.
+
+    Each sample of left is paired with the sample of right closest to it in
+    the given direction, if that is within tolerance. A sample of right
+    claimed by several samples of left is only paired with the closest of
+    them, the earliest on ties, so every sample is matched at most once.
+    Both streams must be sorted by timestamp. The candidates of every
+    sample are found with a binary search and the conflicts are resolved
+    in a single pass, as the candidates increase along left.
+
+    Parameters
+    ----------
+    left : numpy.ndarray
+        Sorted timestamps of the first stream.
+
+    right : numpy.ndarray
+        Sorted timestamps of the second stream.
+
+    tolerance : float
+        Largest difference between the timestamps of a match.
+
+    direction : {'nearest', 'backward', 'forward'}
+        Whether to match each sample of left with the nearest sample of
+        right, the last sample of right at or before it, or the first
+        sample of right at or after it.
+
+    Returns
+    -------
+    left_indices : numpy.ndarray
+        Index in left of each match, in increasing order.
+
+    right_indices : numpy.ndarray
+        Index in right of each match.
+    """
+    if direction not in ('nearest', 'backward', 'forward'):
+        raise ValueError("Unknown direction {!r}".format(direction))
+    left = np.asarray(left, dtype=float)
+    right = np.asarray(right, dtype=float)
+    if len(left) == 0 or len(right) == 0:
+        return np.empty(0, dtype=np.intp), np.empty(0, dtype=np.intp)
+    last = len(right) - 1
+    # Last sample of right at or before, and first at or after, each sample
+    before = np.searchsorted(right, left, side='right') - 1
+    after = np.searchsorted(right, left, side='left')
+    with np.errstate(invalid='ignore'):
+        before_distance = np.where(
+            before >= 0,
+            left - right[np.clip(before, 0, last)],
+            np.inf
+        )
+        after_distance = np.where(
+            after <= last,
+            right[np.clip(after, 0, last)] - left,
+            np.inf
+        )
+    if direction == 'backward':
+        candidates, distance = before, before_distance
+    elif direction == 'forward':
+        candidates, distance = after, after_distance
+    else:
+        closer_after = after_distance < before_distance
+        candidates = np.where(closer_after, after, before)
+        distance = np.where(closer_after, after_distance, before_distance)
+    left_indices = np.flatnonzero(distance <= tolerance)
+    if len(left_indices) == 0:
+        return left_indices, left_indices
+    right_indices = candidates[left_indices]
+    distance = distance[left_indices]
+    # Samples of left claiming the same sample of right are adjacent
+    claims = np.ones(len(right_indices), dtype=bool)
+    claims[1:] = right_indices[1:] != right_indices[:-1]
+    claim = np.cumsum(claims) - 1
+    closest = np.minimum.reduceat(distance, np.flatnonzero(claims))
+    winners = np.flatnonzero(distance == closest[claim])
+    first = np.ones(len(winners), dtype=bool)
+    first[1:] = claim[winners[1:]] != claim[winners[:-1]]
+    winners = winners[first]
+    return left_indices[winners], right_indices[winners]
+
+
+def multi_join(*timestamps):
+    """
+    Match the samples of any number of streams with equal timestamps.
+
+    An inner join of sorted streams. The timestamps of the shortest stream
+    are narrowed down stream by stream, shortest first, to those present in
+    all of them, and the matching samples of every stream are then looked
+    up with merge_join. Each lookup is a binary search, so with m samples in
+    the shortest stream the cost is O(m log n) for every other stream of n
+    samples, and the memory O(m), however many distinct timestamps the
+    streams have between them.
+
+    Parameters
+    ----------
+    *timestamps : numpy.ndarray
+        Sorted timestamps of each stream.
+
+    Returns
+    -------
+    indices : tuple of numpy.ndarray
+        Index of each match in each stream, in order of timestamp.
+    """
+    if not timestamps:
+        return ()
+    order = sorted(range(len(timestamps)), key=lambda i: len(timestamps[i]))
+    shortest = np.asarray(timestamps[order[0]])
+    kept = np.arange(len(shortest))
+    for stream in order[1:]:
+        matched, _ = merge_join(shortest[kept], timestamps[stream])
+        kept = kept[matched]
+    common = shortest[kept]
+    indices = [None] * len(timestamps)
+    indices[order[0]] = kept
+    for stream in order[1:]:
+        _, indices[stream] = merge_join(common, timestamps[stream])
+    return tuple(indices)
+
+
+class StreamingEventBuilder:
+    """
+    Build events from timestamped samples of several streams as they arrive.
+
+    Samples of each stream are held, sorted by timestamp, until a sample
+    with the same timestamp has arrived on every stream. The matched samples
+    are then emitted together as an event by the next call to build(). With
+    a tolerance, the samples of the first stream are instead matched with
+    the nearest samples of the other streams within tolerance, in the given
+    direction, for PVs whose timestamps differ slightly from shot to shot.
+    Samples are not lost when their partners arrive a moment later, on the
+    next push. Unmatched samples are dropped once they are older than
+    horizon, and each stream holds at most maxlen samples, so memory stays
+    bounded when a stream stalls.
+
+    Samples may arrive out of order, within and across streams. Each batch
+    is sorted on its own and merged into the sorted samples already held.
+    With an allowed lateness, the builder keeps a watermark: the oldest of
+    the newest timestamps of the streams, less the lateness. Samples older
+    than the watermark on arrival are late, and are counted and dropped.
+    Events are then only emitted once every stream has advanced past them,
+    and samples left unmatched by then are dropped straight away. Without a
+    tolerance, a match can not be bettered by a sample yet to arrive. With
+    one, events are emitted up to the watermark less the tolerance, and a
+    sample of another stream claimed by several samples of the first stream
+    goes to the closest of those up to there. A later sample of the first
+    stream that is closer still, whether already held or yet to arrive, does
+    not get it.
+    """
+    def __init__(self, streams, horizon, maxlen=10000, tolerance=0,
+                 direction='nearest', lateness=None):
+        """
+        Parameters
+        ----------
+        streams : iterable of str
+            Names of the streams. The first stream gives the timestamps of
+            the events.
+
+        horizon : float
+            Age, in the units of the timestamps, after which unmatched
+            samples are dropped.
+
+        maxlen : int
+            Maximum number of unmatched samples held for each stream. The
+            oldest samples are dropped beyond this.
+
+        tolerance : float
+            Largest difference between the timestamps of the samples of an
+            event. Zero to only match equal timestamps.
+
+        direction : {'nearest', 'backward', 'forward'}
+            Whether the samples of the other streams are matched with the
+            nearest sample of the first stream, the sample before or at it,
+            or the sample after or at it. See nearest_join.
+
+        lateness : float or None
+            How far, in the units of the timestamps, a sample may lag the
+            slowest stream and still be built into an event. None to build
+            events as soon as all their samples are held, without a
+            watermark.
+        """
+        if direction not in ('nearest', 'backward', 'forward'):
+            raise ValueError("Unknown direction {!r}".format(direction))
+        self.streams = tuple(streams)
+        self.horizon = horizon
+        self.maxlen = maxlen
+        self.tolerance = tolerance
+        self.direction = direction
+        self.lateness = lateness
+        self._timestamps = {name: np.empty(0) for name in self.streams}
+        self._values = {name: np.empty(0) for name in self.streams}
+        # Newest timestamp seen on each stream
+        self._newest = {name: -np.inf for name in self.streams}
+        # Number of events built and of samples dropped unmatched
+        self.matched = 0
+        self.expired = 0
+        self.overflowed = 0
+        self.late = 0
+        self._batch_overflowed = 0
+        self._batch_late = 0
+        self.batch_stats = None
+
+    @property
+    def watermark(self):
+        """
+        Timestamp before which samples are late, or None without an allowed
+        lateness. Stays at -inf until every stream has pushed a sample.
+        """
+        if self.lateness is None:
+            return None
+        return min(self._newest.values()) - self.lateness
+
+    @property
+    def pending(self):
+        """
+        Number of unmatched samples held for each stream.
+        """
+        return {name: len(self._timestamps[name]) for name in self.streams}
+
+    def push(self, stream, values, timestamps):
+        """
+        Parameters
+        ----------
+        stream : str
+            Name of the stream the samples belong to.
+
+        values : iterable
+            Values of the samples.
+
+        timestamps : iterable
+            Timestamps of the samples. Must have the same length as values.
+        """
+        values = np.ravel(values)
+        timestamps = np.ravel(timestamps).astype(float)
+        if len(values) != len(timestamps):
+            raise Exception("Values, timestamps lengths differ")
+        if self.lateness is not None:
+            late = timestamps < self.watermark
+            if late.any():
+                self.late += int(late.sum())
+                self._batch_late += int(late.sum())
+                values = values[~late]
+                timestamps = timestamps[~late]
+        if len(values) == 0:
+            return
+        if np.any(np.diff(timestamps) < 0):
+            order = np.argsort(timestamps, kind='mergesort')
+            timestamps = timestamps[order]
+            values = values[order]
+        self._newest[stream] = max(self._newest[stream], timestamps[-1])
+        held = self._timestamps[stream]
+        if len(held) == 0 or timestamps[0] >= held[-1]:
+            timestamps = np.concatenate((held, timestamps))
+            values = np.concatenate((self._values[stream], values))
+        else:
+            # Merge the batch into the samples held, after equal timestamps
+            positions = np.searchsorted(held, timestamps, side='right')
+            timestamps = np.insert(held, positions, timestamps)
+            values = np.insert(self._values[stream], positions, values)
+        overflow = len(timestamps) - self.maxlen
+        if overflow > 0:
+            timestamps = timestamps[overflow:]
+            values = values[overflow:]
+            self.overflowed += overflow
+            self._batch_overflowed += overflow
+        self._timestamps[stream] = timestamps
+        self._values[stream] = values
+
+    def build(self, now=None):
+        """
+        Emit the events matched since the last call and drop the unmatched
+        samples older than horizon. With an allowed lateness, only the
+        events before the watermark are emitted and the unmatched samples
+        before it dropped.
+
+        Parameters
+        ----------
+        now : float or None
+            Time to measure the age of unmatched samples from. Defaults to
+            the newest timestamp pushed on any stream.
+
+        The number of events built, the number of samples dropped, late or
+        otherwise, and the fraction of the samples settled either way that
+        were matched are kept in batch_stats until the next call.
+
+        Returns
+        -------
+        timestamps : numpy.ndarray
+            Timestamp of each event on the first stream, oldest first.
+
+        values : dict of numpy.ndarray
+            Value of each event on every stream, keyed by stream name.
+        """
+        ready = None
+        if self.lateness is not None:
+            # Samples within tolerance of the watermark may still be matched
+            # by ones arriving in time
+            ready = self.watermark - self.tolerance
+        matches = self._match(ready)
+        common = self._timestamps[self.streams[0]][matches[0]]
+        values = {}
+        for name, indices in zip(self.streams, matches):
+            timestamps = self._timestamps[name]
+            matched = np.zeros(len(timestamps), dtype=bool)
+            matched[indices] = True
+            values[name] = self._values[name][indices]
+            self._timestamps[name] = timestamps[~matched]
+            self._values[name] = self._values[name][~matched]
+        self.matched += len(common)
+        if now is None:
+            now = max(self._newest.values())
+        expired = self._expire(now - self.horizon, 'left')
+        if ready is not None:
+            # The other streams keep what a first stream sample after ready
+            # could still match
+            expired += self._expire(ready, 'right', ready - self.tolerance)
+        self._record_batch(len(common), expired)
+        return common, values
+
+    def _match(self, ready=None):
+        """
+        Index of the samples of each event in each stream, among the samples
+        of the first stream up to ready if given, and of the other streams up
+        to the watermark.
+        """
+        streams = [self._timestamps[name] for name in self.streams]
+        if ready is not None:
+            cutoffs = [ready] + [self.watermark] * (len(streams) - 1)
+            streams = [
+                timestamps[:np.searchsorted(timestamps, cutoff, side='right')]
+                for timestamps, cutoff in zip(streams, cutoffs)
+            ]
+        if self.tolerance == 0:
+            return multi_join(*streams)
+        # Tolerances are measured from the first stream, so narrow it down
+        reference = streams[0]
+        kept = np.arange(len(reference))
+        for timestamps in streams[1:]:
+            matched, _ = nearest_join(
+                reference[kept],
+                timestamps,
+                self.tolerance,
+                self.direction
+            )
+            kept = kept[matched]
+        matches = [kept]
+        for timestamps in streams[1:]:
+            _, indices = nearest_join(
+                reference[kept],
+                timestamps,
+                self.tolerance,
+                self.direction
+            )
+            matches.append(indices)
+        return matches
+
+    def _expire(self, cutoff, side, others=None):
+        """
+        Drop the unmatched samples before cutoff, or up to it with side
+        'right', and return how many. The streams after the first are cut
+        at others instead if given.
+        """
+        total = 0
+        for i, name in enumerate(self.streams):
+            expired = int(np.searchsorted(
+                self._timestamps[name],
+                cutoff if i == 0 or others is None else others,
+                side=side
+            ))
+            self._timestamps[name] = self._timestamps[name][expired:]
+            self._values[name] = self._values[name][expired:]
+            total += expired
+        self.expired += total
+        return total
+
+    def _record_batch(self, events, expired):
+        """
+        Keep the statistics of the samples settled by the last build.
+        """
+        overflowed = self._batch_overflowed
+        late = self._batch_late
+        self._batch_overflowed = 0
+        self._batch_late = 0
+        matched = events * len(self.streams)
+        settled = matched + expired + overflowed + late
+        match_rate = matched / settled if settled else np.nan
+        self.batch_stats = {
+            'events': events,
+            'expired': expired,
+            'overflowed': overflowed,
+            'late': late,
+            'match_rate': match_rate,
+            'drop_rate': 1 - match_rate,
+        }
@@ -1,47 +1,2414 @@
+import functools
+import time
+import warnings
+from collections import OrderedDict
+
 import numpy as np
-from collections import deque
 
 
-class BaseHist:
-    def push(self):
-        raise NotImplementedError
+class BaseHist:
+    def push(self):
+        raise NotImplementedError
+
+    def hist(self):
+        raise NotImplementedError
+
+    @property
+    def data(self):
+        raise NotImplementedError
+
+    @data.setter
+    def data(self):
+        raise NotImplementedError
+
+
+def _freeze(result):
+    """
+    Make the arrays of a hist result read-only so it can be shared.
+    """
+    if isinstance(result, tuple):
+        return tuple(_freeze(item) for item in result)
+    if isinstance(result, np.ndarray):
+        result.flags.writeable = False
+    return result
+
+
+def _memoized(method):
+    """
+    Memoize a hist method of a rolling hist per version of the hist and
+    arguments of the call. Results are returned read-only as they are shared
+    between callers.
+    """
+    @functools.wraps(method)
+    def wrapper(self, bins=None, *args, **kwargs):
+        # Results written into caller owned arrays are not shared
+        if kwargs.get('out') is not None:
+            return method(self, bins, *args, **kwargs)
+        if self._cache_version != self._version:
+            self._cache.clear()
+            self._cache_version = self._version
+        key = (
+            method.__name__,
+            self._bins_key(bins),
+            args,
+            tuple(sorted(kwargs.items())),
+        )
+        try:
+            self._cache.move_to_end(key)
+            return self._cache[key]
+        except KeyError:
+            pass
+        result = _freeze(method(self, bins, *args, **kwargs))
+        self._cache[key] = result
+        if len(self._cache) > self.cache_size:
+            self._cache.popitem(last=False)
+        return result
+    return wrapper
+
+
+def _widen(values):
+    """
+    Copy of values, with compactly stored integer counts widened to intp so
+    they do not leak into results.
+    """
+    values = np.asarray(values)
+    if values.dtype.kind in 'iu':
+        return values.astype(np.intp)
+    return values.copy()
+
+
+def _store(values, out):
+    """
+    Copy values into out, or into a new array if out is None.
+    """
+    if out is None:
+        return _widen(values)
+    np.copyto(out, values)
+    return out
+
+
+def _cast(values, dtype):
+    """
+    Values as dtype, truncating fractions for an integer dtype. Values an
+    integer dtype can not hold raise rather than wrap around.
+    """
+    values = np.asarray(values)
+    dtype = np.dtype(dtype)
+    if dtype.kind in 'iu' and values.size:
+        info = np.iinfo(dtype)
+        if (values.dtype.kind == 'f' and not np.all(np.isfinite(values))
+                or values.min() < info.min or values.max() > info.max):
+            raise ValueError(
+                "Values do not fit in {}".format(dtype.name)
+            )
+    return values.astype(dtype, copy=False)
+
+
+def _auto_range(lower, upper):
+    """
+    Range of automatic bins spanning lower to upper, widened around a single
+    value as np.histogram does.
+    """
+    if lower == upper:
+        return lower - 0.5, upper + 0.5
+    return lower, upper
+
+
+def _int_dtype(limit):
+    """
+    Smallest signed integer type holding values of magnitude up to limit.
+    """
+    limit = max(int(limit), 1)
+    for dtype in (np.int8, np.int16, np.int32):
+        if np.iinfo(dtype).max >= limit:
+            return np.dtype(dtype)
+    return np.dtype(np.int64)
+
+
+def _unchanged(totals):
+    """
+    Reduction of the per-bin totals of a binning onto itself.
+    """
+    return totals
+
+
+def _edge_arrays(binning):
+    """
+    Edges of each axis of a binning with a range.
+    """
+    edges = binning.edges
+    if isinstance(edges, tuple):
+        return edges
+    return (edges,)
+
+
+def _bin_counts(indices, weights, nbins):
+    """
+    Histogram bin indices, ignoring negative indices, with one or more
+    channels of weights.
+    """
+    indices = np.asarray(indices, dtype=np.intp)
+    inside = indices >= 0
+    if weights is None:
+        return np.bincount(indices[inside], minlength=nbins)
+    weights = np.asarray(weights)[inside]
+    if weights.ndim == 1:
+        return np.bincount(indices[inside], weights=weights, minlength=nbins)
+    # Offset the bin of each channel so all of them share one bincount
+    channels = weights.shape[1]
+    flat = indices[inside, np.newaxis] * channels + np.arange(channels)
+    return np.bincount(
+        flat.ravel(),
+        weights=weights.ravel(),
+        minlength=nbins * channels
+    ).reshape(nbins, channels)
+
+
+def _moments(inc, sums, sumsq, shift):
+    """
+    Per-bin mean, sample variance and standard error of the mean of weights
+    from their counts, sums and sums of squares about shift.
+    """
+    with np.errstate(divide='ignore', invalid='ignore'):
+        shifted = sums - shift * inc
+        mean = sums / inc
+        variance = (sumsq - shifted * shifted / inc) / (inc - 1)
+        variance = np.where(inc > 1, np.maximum(variance, 0), np.nan)
+        sem = np.sqrt(variance / inc)
+    return mean, variance, sem
+
+
+class Binning:
+    """
+    Histogram bin edges with fast lookup of the bin of each sample.
+
+    Uniform edges, whether given as a number of bins over a range or as an
+    array of evenly spaced edges, are looked up arithmetically with a single
+    multiply and floor. Other edges fall back to a binary search. Both
+    follow np.histogram's rules: every bin is half open except the last,
+    which includes its right edge.
+    """
+    def __init__(self, bins=10, range=None):
+        """
+        Parameters
+        ----------
+        bins : int, iterable or Binning
+            Number of equal width bins in range or the monotonically
+            increasing bin edges, following np.histogram rules for the 'bins'
+            argument.
+
+        range : (float, float) or None
+            Lower and upper edges of the bins when bins is an int. If this is
+            left as None with an int number of bins, the edges are left
+            undetermined until a range is provided by the data.
+        """
+        if isinstance(bins, Binning):
+            range = bins.range if range is None else range
+            bins = bins.nbins if bins.edges is None else bins.edges
+        self.nbins = None
+        self.edges = None
+        self.uniform = False
+        if np.ndim(bins) == 0:
+            self.nbins = int(bins)
+            if self.nbins < 1:
+                raise ValueError("Number of bins must be positive")
+            if range is not None:
+                self._set_edges(
+                    np.linspace(range[0], range[1], self.nbins + 1),
+                    uniform=True,
+                )
+        else:
+            edges = np.array(bins, dtype=float)
+            if edges.ndim != 1 or len(edges) < 2:
+                raise ValueError("Bin edges must be a 1d array of two or more")
+            if np.any(np.diff(edges) < 0):
+                raise ValueError("Bin edges must increase monotonically")
+            widths = np.diff(edges)
+            self._set_edges(
+                edges,
+                uniform=np.allclose(widths, widths[0], rtol=1e-9, atol=0),
+            )
+
+    def _set_edges(self, edges, uniform):
+        self.edges = edges
+        self.edges.flags.writeable = False
+        self.widths = np.diff(edges)
+        self.widths.flags.writeable = False
+        self.nbins = len(edges) - 1
+        self.uniform = bool(uniform) and edges[-1] > edges[0]
+        if self.uniform:
+            self._norm = self.nbins / (edges[-1] - edges[0])
+
+    @property
+    def range(self):
+        if self.edges is None:
+            return None
+        return float(self.edges[0]), float(self.edges[-1])
+
+    def __eq__(self, other):
+        if not isinstance(other, Binning):
+            return NotImplemented
+        if self.edges is None or other.edges is None:
+            return self.edges is other.edges and self.nbins == other.nbins
+        return (
+            len(self.edges) == len(other.edges)
+            and np.array_equal(self.edges, other.edges)
+        )
+
+    def _key(self):
+        """
+        Hashable description of the bins.
+        """
+        if self.edges is None:
+            return self.nbins, None
+        return self.nbins, self.edges.tobytes()
+
+    def __repr__(self):
+        return '{}(nbins={}, range={}, uniform={})'.format(
+            type(self).__name__, self.nbins, self.range, self.uniform
+        )
+
+    def _starts(self, other):
+        """
+        First bin of this binning in each bin of other, or None if the bins
+        of other are not made of whole bins of this binning.
+        """
+        if self.edges is None or other.edges is None:
+            return None
+        # Edges computed for different numbers of bins differ by rounding
+        tolerance = 1e-9 * self.widths.min()
+        # The last bin includes its right edge, so a bin of other can only
+        # end inside this binning if that edge is half open in both
+        if abs(other.edges[-1] - self.edges[-1]) > tolerance:
+            return None
+        starts = np.searchsorted(self.edges, other.edges - tolerance)
+        starts = np.minimum(starts, self.nbins)
+        if np.any(np.abs(self.edges[starts] - other.edges) > tolerance):
+            return None
+        return starts[:-1]
+
+    def reduction(self, other):
+        """
+        Function summing per-bin totals of this binning into the bins of a
+        coarser aligned binning.
+
+        Every edge of other must be an edge of this binning, and both must
+        end on the same edge. The bins of other may start at any edge of
+        this binning.
+
+        Parameters
+        ----------
+        other : Binning
+            Coarser binning.
+
+        Returns
+        -------
+        reduce : callable or None
+            Function taking totals with the bins of this binning along the
+            first axis and returning those of other, at a cost proportional
+            to the number of bins. None if other is not aligned with this
+            binning.
+        """
+        starts = self._starts(other)
+        if starts is None:
+            return None
+        return lambda totals: np.add.reduceat(totals, starts, axis=0)
+
+    def coarsen(self, factor):
+        """
+        Binning merging every factor adjacent bins of this binning, with a
+        narrower last bin if factor does not divide the number of bins.
+
+        Parameters
+        ----------
+        factor : int
+            Number of bins merged into each bin.
+        """
+        if self.edges is None:
+            raise ValueError("Only bins with a range can be coarsened")
+        edges = self.edges[::factor]
+        if self.nbins % factor:
+            edges = np.append(edges, self.edges[-1])
+        return Binning(edges)
+
+    def index(self, data):
+        """
+        Find the bin of each sample.
+
+        Parameters
+        ----------
+        data : numpy.ndarray
+            Samples to bin.
+
+        Returns
+        -------
+        indices : numpy.ndarray
+            Bin index of each sample or -1 for samples outside of the edges.
+        """
+        if self.edges is None:
+            raise ValueError("Binning has no range to index data against")
+        data = np.asarray(data, dtype=float)
+        edges = self.edges
+        nbins = self.nbins
+        if not self.uniform:
+            indices = np.searchsorted(edges, data, side='right') - 1
+            indices[data == edges[-1]] = nbins - 1
+            indices[(indices < 0) | (indices >= nbins)] = -1
+            return indices
+        indices = np.full(data.shape, -1, dtype=np.intp)
+        with np.errstate(invalid='ignore'):
+            scaled = np.floor((data - edges[0]) * self._norm)
+            near = (scaled >= -1) & (scaled <= nbins)
+        samples = data[near]
+        near_indices = np.clip(scaled[near], 0, nbins - 1).astype(np.intp)
+        # Correct for floating point error at the edges by comparing against
+        # the edges themselves, as np.histogram does
+        near_indices -= samples < edges[near_indices]
+        near_indices += (
+            (samples >= edges[near_indices + 1])
+            & (near_indices < nbins - 1)
+        )
+        near_indices[samples > edges[-1]] = -1
+        indices[near] = near_indices
+        return indices
+
+    def counts(self, indices, weights=None):
+        """
+        Histogram precomputed bin indices.
+
+        Parameters
+        ----------
+        indices : numpy.ndarray
+            Bin indices as returned by Binning.index.
+
+        weights : numpy.ndarray or None
+            Weight of each sample, matching indices in length. A two
+            dimensional array of shape (samples, channels) histograms every
+            channel in a single bincount.
+
+        Returns
+        -------
+        counts : numpy.ndarray
+            Number of samples, or sum of the weights, in each bin. Has shape
+            (bins, channels) for two dimensional weights.
+        """
+        return _bin_counts(indices, weights, self.nbins)
+
+    def histogram(self, data, weights=None, density=False):
+        """
+        Equivalent of np.histogram using this binning.
+
+        Parameters
+        ----------
+        data : numpy.ndarray
+            Samples to bin.
+
+        weights : numpy.ndarray or None
+            Weight of each sample, matching data in length.
+
+        density : bool
+            Follows np.histogram's rules for 'density' argument.
+
+        Returns
+        -------
+        hist : numpy.ndarray
+            Values of the histogram.
+
+        edges : numpy.ndarray
+            Bin edges.
+        """
+        counts = self.counts(self.index(data), weights=weights)
+        if density:
+            counts = self.density(counts)
+        return counts, self.edges.copy()
+
+    def density(self, counts, out=None):
+        """
+        Normalize counts so the histogram integrates to one. Counts with
+        shape (bins, channels) are normalized per channel.
+
+        Parameters
+        ----------
+        counts : numpy.ndarray
+            Histogram to normalize.
+
+        out : numpy.ndarray or None
+            Float array to write the result into, which may be counts itself.
+        """
+        widths = self.widths
+        if np.ndim(counts) == 2:
+            widths = widths[:, np.newaxis]
+        total = counts.sum(axis=0)
+        out = np.divide(counts, widths, out=out)
+        out /= total
+        return out
+
+
+class Binning2D:
+    """
+    Pair of Binnings over the two axes of a two dimensional histogram.
+
+    Bins are numbered in row-major order over (x, y) so a two dimensional
+    histogram is maintained as a flat array of counts, which is what the
+    rolling histograms expect of a binning.
+    """
+    def __init__(self, bins=10, range=None):
+        """
+        Parameters
+        ----------
+        bins : int, iterable or Binning2D
+            Follows np.histogram2d rules for the 'bins' argument: a number of
+            bins or edges for both axes, or a pair of either.
+
+        range : ((float, float), (float, float)) or None
+            Lower and upper edges of each axis for axes given a number of
+            bins.
+        """
+        if isinstance(bins, Binning2D):
+            bins = (bins.x, bins.y)
+        # Same interpretation of bins as np.histogram2d
+        try:
+            pair = len(bins) == 2
+        except TypeError:
+            pair = False
+        if not pair:
+            bins = (bins, bins)
+        if range is None:
+            range = (None, None)
+        self.x = Binning(bins[0], range=range[0])
+        self.y = Binning(bins[1], range=range[1])
+
+    @property
+    def nbins(self):
+        return self.x.nbins * self.y.nbins
+
+    @property
+    def shape(self):
+        return self.x.nbins, self.y.nbins
+
+    @property
+    def edges(self):
+        if self.x.edges is None or self.y.edges is None:
+            return None
+        return self.x.edges, self.y.edges
+
+    def __eq__(self, other):
+        if not isinstance(other, Binning2D):
+            return NotImplemented
+        return self.x == other.x and self.y == other.y
+
+    def _key(self):
+        """
+        Hashable description of the bins.
+        """
+        return self.x._key(), self.y._key()
+
+    def __repr__(self):
+        return '{}(x={!r}, y={!r})'.format(type(self).__name__, self.x, self.y)
+
+    def reduction(self, other):
+        """
+        Function summing flat per-bin totals of this binning into the bins
+        of a coarser binning whose axes are each aligned with those of this
+        binning, or None. See Binning.reduction.
+        """
+        x_starts = self.x._starts(other.x)
+        y_starts = self.y._starts(other.y)
+        if x_starts is None or y_starts is None:
+            return None
+
+        def reduce(totals):
+            grid = totals.reshape(self.shape + totals.shape[1:])
+            grid = np.add.reduceat(grid, x_starts, axis=0)
+            grid = np.add.reduceat(grid, y_starts, axis=1)
+            return grid.reshape((-1,) + totals.shape[1:])
+        return reduce
+
+    def coarsen(self, factor):
+        """
+        Binning merging every factor adjacent bins along both axes. See
+        Binning.coarsen.
+        """
+        return Binning2D((self.x.coarsen(factor), self.y.coarsen(factor)))
+
+    def index(self, data):
+        """
+        Find the flat bin of each sample.
+
+        Parameters
+        ----------
+        data : numpy.ndarray
+            Samples of shape (samples, 2).
+
+        Returns
+        -------
+        indices : numpy.ndarray
+            Flat bin index of each sample or -1 for samples outside of the
+            edges.
+        """
+        data = np.asarray(data, dtype=float)
+        x_indices = self.x.index(data[:, 0])
+        y_indices = self.y.index(data[:, 1])
+        indices = x_indices * self.y.nbins + y_indices
+        indices[(x_indices < 0) | (y_indices < 0)] = -1
+        return indices
+
+    def counts(self, indices, weights=None):
+        """
+        Histogram precomputed flat bin indices into a flat array.
+        """
+        return _bin_counts(indices, weights, self.nbins)
+
+    def density(self, counts):
+        """
+        Normalize flat counts so the histogram integrates to one.
+        """
+        area = np.outer(np.diff(self.x.edges), np.diff(self.y.edges)).ravel()
+        return counts / area / counts.sum()
+
+
+class RingBuffer:
+    """
+    Fixed length FIFO buffer backed by a preallocated numpy array.
+
+    Elements are written into an array with twice the capacity of the buffer.
+    When the end of the array is reached, the live elements are moved back to
+    the front in a single copy. The buffered elements are therefore always
+    contiguous, in order of arrival, and can be exposed without copying.
+
+    Buffers with columns hold rows of that many values. Each column is stored
+    contiguously and the buffer is read and written as (rows, columns)
+    arrays.
+    """
+    def __init__(self, maxlen, dtype=float, columns=None):
+        """
+        Parameters
+        ----------
+        maxlen : int
+            Maximum number of elements held by the buffer.
+
+        dtype : numpy.dtype
+            Type of the elements stored in the buffer.
+
+        columns : int or None
+            Number of values in each element, for a buffer of rows.
+        """
+        self._maxlen = int(maxlen)
+        self.columns = columns
+        if columns is None:
+            shape = (2 * self._maxlen,)
+        else:
+            shape = (columns, 2 * self._maxlen)
+        self._buffer = np.empty(shape, dtype=dtype)
+        self._start = 0
+        self._stop = 0
+
+    def __len__(self):
+        return self._stop - self._start
+
+    @property
+    def maxlen(self):
+        return self._maxlen
+
+    @property
+    def dtype(self):
+        return self._buffer.dtype
+
+    @property
+    def view(self):
+        """
+        Read-only view of the buffered elements, oldest first. The view is
+        only valid until the next modification of the buffer.
+        """
+        view = self._buffer[..., self._start:self._stop]
+        view.flags.writeable = False
+        return view.T
+
+    def clear(self):
+        self._start = 0
+        self._stop = 0
+
+    def popleft(self, n):
+        """
+        Remove the n oldest elements of the buffer.
+
+        Parameters
+        ----------
+        n : int
+            Number of elements to remove.
+
+        Returns
+        -------
+        removed : numpy.ndarray
+            Copy of the removed elements, oldest first.
+        """
+        n = max(0, min(n, len(self)))
+        removed = self._buffer[..., self._start:self._start + n].T.copy()
+        self._start += n
+        if self._start == self._stop:
+            self.clear()
+        return removed
+
+    def pop(self, n):
+        """
+        Remove the n newest elements of the buffer.
+
+        Parameters
+        ----------
+        n : int
+            Number of elements to remove.
+        """
+        n = max(0, min(n, len(self)))
+        self._stop -= n
+        if self._start == self._stop:
+            self.clear()
+
+    def extend(self, values):
+        """
+        Append values to the buffer, evicting the oldest elements when the
+        buffer is full.
+
+        Parameters
+        ----------
+        values : numpy.ndarray
+            Array of the elements to append, with shape (rows, columns) for
+            a buffer with columns.
+
+        Returns
+        -------
+        evicted : numpy.ndarray
+            Copy of the elements evicted to make room for values, oldest
+            first.
+        """
+        values = values[len(values) - min(len(values), self._maxlen):]
+        n = len(values)
+        evicted = self.popleft(len(self) + n - self._maxlen)
+        if self._stop + n > self._buffer.shape[-1]:
+            live = len(self)
+            self._buffer[..., :live] = self._buffer[..., self._start:self._stop]
+            self._start = 0
+            self._stop = live
+        self._buffer[..., self._stop:self._stop + n] = values.T
+        self._stop += n
+        return evicted
+
+
+class RunningExtrema:
+    """
+    Minimum and maximum of a rolling window of samples.
+
+    Each extreme is tracked with a monotonic queue of the samples that could
+    still become the extreme of the window, kept in a pair of RingBuffers. A
+    push drops the queued samples it supersedes and appends the samples of
+    the batch that are not superseded by a later one in the same batch, both
+    found with vectorized operations. The extremes are then read from the
+    front of the queues in constant time. Non-finite samples are ignored.
+    """
+    def __init__(self, maxlen):
+        """
+        Parameters
+        ----------
+        maxlen : int
+            Number of samples in the rolling window.
+        """
+        self._maxlen = int(maxlen)
+        # Sequence number of the next sample and of the oldest in the window
+        self._count = 0
+        self._start = 0
+        # The maximum is tracked as the minimum of the negated samples
+        self._queues = [
+            (RingBuffer(maxlen, dtype=float), RingBuffer(maxlen, dtype=np.int64))
+            for _ in range(2)
+        ]
+
+    def __len__(self):
+        return self._count - self._start
+
+    def clear(self):
+        self._count = 0
+        self._start = 0
+        for values, sequence in self._queues:
+            values.clear()
+            sequence.clear()
+
+    @staticmethod
+    def _push_min(values, sequence, batch, batch_sequence):
+        """
+        Push a batch onto a monotonic queue tracking the minimum.
+        """
+        if len(batch) == 0:
+            return
+        # Queued samples no smaller than the smallest of the batch can never
+        # be the minimum again. The queue increases so they are a suffix.
+        values.pop(
+            len(values)
+            - np.searchsorted(values.view, batch.min(), side='left')
+        )
+        sequence.pop(len(sequence) - len(values))
+        # Samples of the batch no smaller than a later one are superseded
+        later_min = np.minimum.accumulate(batch[::-1])[::-1]
+        keep = np.ones(len(batch), dtype=bool)
+        keep[:-1] = batch[:-1] < later_min[1:]
+        values.extend(batch[keep])
+        sequence.extend(batch_sequence[keep])
+
+    def extend(self, data):
+        """
+        Push samples into the window, evicting the oldest samples beyond
+        maxlen.
+
+        Parameters
+        ----------
+        data : numpy.ndarray
+            Samples to push.
+        """
+        data = np.asarray(data, dtype=float)[-self._maxlen:]
+        sequence = np.arange(self._count, self._count + len(data))
+        self._count += len(data)
+        finite = np.isfinite(data)
+        data = data[finite]
+        sequence = sequence[finite]
+        for sign, (values, queue_sequence) in zip((1, -1), self._queues):
+            self._push_min(values, queue_sequence, sign * data, sequence)
+        self.popleft(len(self) - self._maxlen)
+
+    def popleft(self, n):
+        """
+        Evict the n oldest samples of the window.
+
+        Parameters
+        ----------
+        n : int
+            Number of samples to evict.
+        """
+        self._start += max(0, min(n, len(self)))
+        for values, sequence in self._queues:
+            expired = np.searchsorted(sequence.view, self._start, side='left')
+            values.popleft(expired)
+            sequence.popleft(expired)
+
+    @property
+    def range(self):
+        """
+        Minimum and maximum of the finite samples in the window, or None if
+        there are none.
+        """
+        (min_values, _), (max_values, _) = self._queues
+        if len(min_values) == 0:
+            return None
+        return float(min_values.view[0]), float(-max_values.view[0])
+
+
+class ColumnExtrema:
+    """
+    RunningExtrema of each column of a rolling window of samples with
+    several columns. Samples with a non-finite column are ignored on every
+    column.
+    """
+    def __init__(self, maxlen, columns):
+        """
+        Parameters
+        ----------
+        maxlen : int
+            Number of samples in the rolling window.
+
+        columns : int
+            Number of columns of each sample.
+        """
+        self._columns = [RunningExtrema(maxlen) for _ in range(columns)]
+
+    def __len__(self):
+        return len(self._columns[0])
+
+    def clear(self):
+        for extrema in self._columns:
+            extrema.clear()
+
+    def extend(self, data):
+        """
+        Push samples of shape (samples, columns) into the window, evicting
+        the oldest samples beyond maxlen.
+        """
+        data = np.array(data, dtype=float, ndmin=2)
+        data[~np.isfinite(data).all(axis=1)] = np.nan
+        for extrema, column in zip(self._columns, data.T):
+            extrema.extend(column)
+
+    def popleft(self, n):
+        """
+        Evict the n oldest samples of the window.
+        """
+        for extrema in self._columns:
+            extrema.popleft(n)
+
+    @property
+    def range(self):
+        """
+        Minimum and maximum of each column of the finite samples in the
+        window, or None if there are none.
+        """
+        ranges = [extrema.range for extrema in self._columns]
+        if ranges[0] is None:
+            return None
+        return tuple(np.array(extreme) for extreme in zip(*ranges))
+
+
+class HistState:
+    """
+    Compact summary of a histogram which can be combined with the summaries
+    of other histograms over the same bins.
+
+    Holds the per-bin counts and, for weighted hists, the per-bin sums of the
+    weights and their sums of squares about a reference weight, along with
+    the extremes of the samples. merge() is associative, so slices of a long
+    run can be histogrammed independently, by separate processes if need be,
+    and reduced in any grouping:
+
+    >>> total = functools.reduce(HistState.merge, states)
+
+    States pickle, so they can be returned from multiprocessing workers.
+    """
+    def __init__(self, binning, counts, sums=None, sumsq=None, shift=0.0,
+                 extrema=None):
+        """
+        Parameters
+        ----------
+        binning : Binning or Binning2D
+            Bins of the histogram. Must have edges.
+
+        counts : numpy.ndarray
+            Number of samples in each bin.
+
+        sums : numpy.ndarray or None
+            Sum of the weights in each bin, for weighted hists.
+
+        sumsq : numpy.ndarray or None
+            Sum of the squares of the weights about shift in each bin.
+
+        shift : float or numpy.ndarray
+            Reference weight the squares are taken about.
+
+        extrema : (numpy.ndarray, numpy.ndarray) or None
+            Minimum and maximum of the samples, per column for samples with
+            several columns, or None if there were no samples.
+        """
+        if binning.edges is None:
+            raise ValueError("Hist states need bins with a range")
+        if sumsq is not None and sums is None:
+            raise ValueError("Sums of squares need the sums of the weights")
+        self.binning = binning
+        self.counts = counts
+        self.sums = sums
+        self.sumsq = sumsq
+        self.shift = shift
+        self.extrema = extrema
+
+    def __repr__(self):
+        return '{}(binning={!r}, total={})'.format(
+            type(self).__name__,
+            self.binning,
+            self.counts.sum(),
+        )
+
+    def merge(self, other):
+        """
+        Combine the state with that of another histogram over the same bins.
+
+        Parameters
+        ----------
+        other : HistState
+            State to merge. Must have the same bins and the same sums as this
+            state.
+
+        Returns
+        -------
+        state : HistState
+            New state of the samples of both. Neither input is modified.
+        """
+        if self.binning != other.binning:
+            raise ValueError("Can only merge states with the same bins")
+        if (self.sums is None) != (other.sums is None) or (
+                (self.sumsq is None) != (other.sumsq is None)):
+            raise ValueError("Can only merge states with the same sums")
+        sums = sumsq = None
+        if self.sums is not None:
+            sums = self.sums + other.sums
+        if self.sumsq is not None:
+            # Move the squares of the other state onto the shift of this one
+            delta = other.shift - self.shift
+            sumsq = (
+                self.sumsq
+                + other.sumsq
+                + 2 * delta * (other.sums - other.shift * other.counts)
+                + delta * delta * other.counts
+            )
+        if self.counts.dtype.kind in 'iu' and other.counts.dtype.kind in 'iu':
+            counts = np.add(self.counts, other.counts, dtype=np.int64)
+        else:
+            counts = self.counts + other.counts
+        return HistState(
+            self.binning,
+            counts,
+            sums=sums,
+            sumsq=sumsq,
+            shift=self.shift,
+            extrema=self._merge_extrema(self.extrema, other.extrema),
+        )
+
+    @staticmethod
+    def _merge_extrema(first, second):
+        if first is None:
+            return second
+        if second is None:
+            return first
+        return np.fmin(first[0], second[0]), np.fmax(first[1], second[1])
+
+    def hist(self, density=False):
+        """
+        Histogram of the merged samples, the weighted one if the state has
+        sums.
+
+        Parameters
+        ---------
+        density : bool
+            Follows np.histogram's rules for 'density' argument.
+
+        Returns
+        -------
+        hist : numpy.ndarray
+            Counts or sums of the weights of each bin.
+
+        bins : numpy.ndarray
+            Bin edges, or the x and y edges for two dimensional bins.
+        """
+        totals = self.counts if self.sums is None else self.sums
+        if density:
+            totals = self.binning.density(totals)
+        else:
+            totals = totals.copy()
+        if isinstance(self.binning, Binning2D):
+            xedges, yedges = self.binning.edges
+            return totals.reshape(self.binning.shape), xedges, yedges
+        return totals, self.binning.edges
+
+    def moments(self):
+        """
+        Per-bin statistics of the weights of the merged samples, as returned
+        by RapidTransmissionHist.moments().
+        """
+        if self.sumsq is None:
+            raise ValueError("State has no sums of squares of the weights")
+        mean, variance, sem = _moments(
+            self.counts, self.sums, self.sumsq, self.shift
+        )
+        return self.counts.copy(), mean, variance, sem, self.binning.edges
+
+
+class RapidHist(BaseHist):
+    """
+    Wrapper on np.histogram for rapidly regenerating histograms of dynamic data
+
+    The bin counts are maintained incrementally. Each push adds the bins of
+    the new samples and subtracts the bins of the samples falling off the
+    rolling window so hist() only costs as much as the number of bins.
+
+    When the bins are given as a number without a range, the range follows
+    the minimum and maximum of the window as np.histogram would pick it. The
+    extremes are tracked by a RunningExtrema and the window is only rebinned
+    when they change.
+
+    In decay mode no samples are kept at all. Each push multiplies the bin
+    totals by the decay factor before adding the new counts, giving a
+    recency weighted histogram in memory proportional to the number of bins.
+
+    The samples are stored with the given dtype, so float32 halves the memory
+    of a long window. Bin indices and counts are kept in the smallest integer
+    types holding the number of bins and maxlen.
+
+    Every change to the window bumps the version of the hist. Results of
+    hist() are cached per version and arguments, and returned as read-only
+    arrays, so repeated reads between pushes are free.
+
+    Bins whose edges are all edges of the default bins, such as every fifth
+    edge, are summed from the default bin totals rather than binned from the
+    window. Fine default bins can therefore be viewed at any coarser
+    resolution, or all of them at once with pyramid(), for the cost of the
+    bins alone.
+    """
+    # Weights of the samples in the window, for the weighted subclasses
+    _weights = None
+    # Number of hist() results cached for the current version
+    cache_size = 8
+    # Binning type and number of columns of each sample
+    _binning_type = Binning
+    _data_columns = None
+
+    def __init__(self, maxlen, minlen=None, bins=None, decay=None,
+                 dtype=None):
+        """
+        Parameters
+        ----------
+        maxlen : int or None
+            Maximum number of data points for hist. Unused in decay mode.
+
+        minlen : int or None
+            Minimum number of data points for hist. Causes error to be thrown.
+            In decay mode this applies to the decayed total of the counts.
+
+        bins : int, iterable, Binning or None
+            Set up default bins for the hist following np.histogram rules for
+            'bins' argument. Must have a range in decay mode.
+
+        decay : float or None
+            Factor between 0 and 1 applied to the bin totals on every push.
+            Enables decay mode when given.
+
+        dtype : numpy.dtype or None
+            Type the data is stored as. Defaults to float64.
+        """
+        if decay is not None and not 0 < decay <= 1:
+            raise ValueError("Decay factor must be in (0, 1]")
+        self.decay = decay
+        maxlen = self._capacity(maxlen, decay)
+        self._data = RingBuffer(
+            maxlen,
+            dtype=float if dtype is None else dtype,
+            columns=self._data_columns
+        )
+        # Bin index of each sample in self._data, -1 for samples outside the
+        # edges. Only maintained when the default binning has a range.
+        self._indices = RingBuffer(maxlen, dtype=np.int8)
+        self._counts = None
+        # Number of bins and window extremes for bins without a range
+        self._auto_bins = None
+        self._extrema = None
+        self._evicted = 0
+        self._version = 0
+        self._cache = OrderedDict()
+        self._cache_version = None
+        if bins is None:
+            self.bins = 10
+        else:
+            self.bins = bins
+        self.minlen = minlen
+
+    @property
+    def bins(self):
+        return self._bins
+
+    @bins.setter
+    def bins(self, bins):
+        """
+        Set the default bins, recounting the current window.
+        """
+        binning = self._binning_type(bins)
+        self._auto_bins = None
+        self._extrema = None
+        if binning.edges is None:
+            if self.decay is not None:
+                raise ValueError("Decaying hists need bins with a range")
+            self._auto_bins = binning
+            self._extrema = self._running_extrema()
+            self._extrema.extend(self._data.view)
+            binning = self._auto_binning()
+        self._bins = bins
+        self._binning = binning
+        self._rebin()
+
+    def _running_extrema(self):
+        """
+        Tracker of the extremes of the window for bins without a range.
+        """
+        return RunningExtrema(self._data.maxlen)
+
+    def _auto_binning(self):
+        """
+        Binning spanning the extremes of the window following np.histogram's
+        rules for a number of bins without a range.
+        """
+        window_range = self._extrema.range
+        if window_range is None:
+            return self._auto_bins
+        return Binning(
+            self._auto_bins.nbins,
+            range=_auto_range(*window_range)
+        )
+
+    def _update_auto_range(self):
+        """
+        Rebin the window if its extremes moved the range of automatic bins.
+        Returns whether the window was rebinned.
+        """
+        if self._extrema is None:
+            return False
+        binning = self._auto_binning()
+        if binning == self._binning:
+            return False
+        self._binning = binning
+        self._rebin()
+        return True
+
+    @staticmethod
+    def _capacity(maxlen, decay):
+        """
+        Number of samples to keep, none in decay mode.
+        """
+        if decay is not None:
+            return 0
+        return maxlen
+
+    @property
+    def binning(self):
+        return self._binning
+
+    @property
+    def version(self):
+        """
+        Counter bumped on every change to the window.
+        """
+        return self._version
+
+    def _bins_key(self, bins):
+        """
+        Hashable description of a bins argument to hist().
+        """
+        if bins is None:
+            return None
+        return self._binning_type(bins)._key()
+
+    @property
+    def incremental(self):
+        """
+        Whether the bin state is maintained incrementally on push.
+        """
+        return self._binning.edges is not None
+
+    def _rebin(self):
+        """
+        Recompute the bin index of every sample in the window and the
+        incrementally maintained state derived from them. In decay mode this
+        clears the hist as there are no samples to recompute from.
+        """
+        self._version += 1
+        self._indices.clear()
+        if not self.incremental:
+            self._counts = None
+            return
+        index_dtype = _int_dtype(self._binning.nbins)
+        if self._indices.dtype != index_dtype:
+            self._indices = RingBuffer(self._data.maxlen, dtype=index_dtype)
+        self._indices.extend(self._binning.index(self._data.view))
+        self._resync()
+
+    def _resync(self):
+        """
+        Recompute the incrementally maintained state from the bin indices
+        of the window, discarding any accumulated rounding error.
+        """
+        self._reset()
+        weights = None if self._weights is None else self._weights.view
+        self._add(self._indices.view, weights, 1)
+        self._evicted = 0
+
+    def _reset(self):
+        """
+        Zero the incrementally maintained state.
+        """
+        if self.decay is None:
+            dtype = _int_dtype(self._data.maxlen)
+        else:
+            dtype = float
+        self._counts = np.zeros(self._binning.nbins, dtype=dtype)
+
+    def _add(self, indices, weights, sign):
+        """
+        Add (sign=1) or remove (sign=-1) binned samples from the
+        incrementally maintained state.
+        """
+        if sign > 0:
+            self._counts += self._binning.counts(indices)
+        else:
+            self._counts -= self._binning.counts(indices)
+
+    def _scale(self, factor):
+        """
+        Multiply the incrementally maintained state by factor.
+        """
+        self._counts *= factor
+
+    def _extend(self, data, weights=None):
+        """
+        Append new samples to the rolling window and update the
+        incrementally maintained state with the new and evicted samples.
+        """
+        self._version += 1
+        data = np.asarray(data, dtype=self._data.dtype)
+        if weights is not None:
+            # Count the weights as they are stored, so evictions cancel
+            weights = _cast(weights, self._weights.dtype)
+        if self.decay is not None:
+            self._scale(self.decay)
+            self._add(self._binning.index(data), weights, 1)
+            return
+        maxlen = self._data.maxlen
+        self._data.extend(data)
+        evicted_weights = None
+        if weights is not None:
+            evicted_weights = self._weights.extend(weights)
+            weights = weights[-maxlen:]
+        if self._extrema is not None:
+            self._extrema.extend(data)
+            if self._update_auto_range():
+                return
+        if not self.incremental or len(data) == 0:
+            return
+        indices = self._binning.index(data)
+        evicted = self._indices.extend(indices)
+        self._add(evicted, evicted_weights, -1)
+        self._add(indices[-maxlen:], weights, 1)
+        self._count_evicted(len(evicted))
+
+    def _popleft(self, n):
+        """
+        Remove the n oldest samples from the rolling window and the
+        incrementally maintained state.
+        """
+        self._version += 1
+        self._data.popleft(n)
+        evicted_weights = None
+        if self._weights is not None:
+            evicted_weights = self._weights.popleft(n)
+        if self._extrema is not None:
+            self._extrema.popleft(n)
+            if self._update_auto_range():
+                return
+        if not self.incremental:
+            return
+        evicted = self._indices.popleft(n)
+        self._add(evicted, evicted_weights, -1)
+        self._count_evicted(len(evicted))
+
+    def _count_evicted(self, n):
+        # Floating point sums drift when samples are subtracted, so rebuild
+        # them once per turnover of the window
+        self._evicted += n
+        if self._evicted >= self._data.maxlen:
+            self._resync()
+
+    def _check_minlen(self):
+        if self.minlen is not None:
+            if self.decay is None:
+                size = len(self._data)
+            else:
+                size = self._counts.sum()
+            if size < self.minlen:
+                raise Exception("Insufficient data")
+
+    def _resolve_binning(self, bins):
+        """
+        Return the Binning for a bins argument to hist() and the function
+        deriving its totals from the incrementally maintained ones. The
+        function is None if the window has to be binned again, as the
+        binning is neither the default nor a coarser binning aligned with it.
+        """
+        if bins is None:
+            binning = self._binning
+        else:
+            binning = self._binning_type(bins)
+            if binning.edges is None and binning == self._auto_bins:
+                binning = self._binning
+        reduce = None
+        if self.incremental:
+            if binning == self._binning:
+                reduce = _unchanged
+            else:
+                reduce = self._binning.reduction(binning)
+        if self.decay is not None and reduce is None:
+            raise Exception(
+                "Decaying hists only hold their default bins and coarser "
+                "bins aligned with them"
+            )
+        return binning, reduce
+
+    def _window_binning(self, binning):
+        """
+        Give a binning without a range the range of the data in the window.
+        """
+        if binning.edges is None:
+            binning = Binning(
+                np.histogram_bin_edges(self._data.view, bins=binning.nbins)
+            )
+        return binning
+
+    def _window_extrema(self):
+        """
+        Minimum and maximum of the finite samples of the window, per column
+        for samples with several columns, or None if there are none.
+        """
+        if self._extrema is not None:
+            window_range = self._extrema.range
+            if window_range is None:
+                return None
+            return np.array(window_range[0]), np.array(window_range[1])
+        data = self._data.view
+        finite = np.isfinite(data)
+        if finite.ndim > 1:
+            finite = finite.all(axis=1)
+        if not finite.any():
+            return None
+        data = data[finite]
+        return data.min(axis=0), data.max(axis=0)
+
+    def _state_fields(self, binning, reduce, indices):
+        """
+        Fields of the HistState of the window for binning. Reduce derives
+        them from the incrementally maintained state, or is None, in which
+        case indices are the bin indices of the window.
+        """
+        if reduce is not None:
+            counts = reduce(self._counts)
+        else:
+            counts = binning.counts(indices)
+        # Merged states count beyond the compact type of a single window
+        if counts.dtype.kind in 'iu':
+            counts = counts.astype(np.int64)
+        else:
+            counts = np.array(counts)
+        return {'counts': counts}
+
+    def state(self, bins=None):
+        """
+        Mergeable summary of the histogram.
+
+        Parameters
+        ---------
+        bins : int, iterable, Binning or None
+            Force binning on the state. Defaults to binning set at class
+            instantiation if this is left as None. States are only mergeable
+            if they share bins, so give hists sharded across workers the same
+            bins with a range.
+
+        Returns
+        -------
+        state : HistState
+            Counts and sums of the window, decayed in decay mode. In decay
+            mode no samples are kept so the extrema are unknown and None.
+        """
+        binning, reduce = self._resolve_binning(bins)
+        indices = None
+        if reduce is None:
+            binning = self._window_binning(binning)
+            indices = binning.index(self._data.view)
+        extrema = None
+        if self.decay is None:
+            extrema = self._window_extrema()
+        return HistState(
+            binning,
+            extrema=extrema,
+            **self._state_fields(binning, reduce, indices)
+        )
+
+    def checkpoint(self):
+        """
+        Copy of the window and the bin state of the hist as a dictionary of
+        arrays, as written by save(). Taking a checkpoint only copies
+        buffers, so it can be taken on the event loop and written out from
+        another thread.
+        """
+        arrays = {
+            'decay': np.nan if self.decay is None else self.decay,
+            'data': self._data.view.copy(),
+        }
+        if self._weights is not None:
+            arrays['weights'] = self._weights.view.copy()
+        if self.incremental:
+            for axis, edges in enumerate(_edge_arrays(self._binning)):
+                arrays['edges_{}'.format(axis)] = edges
+            arrays['indices'] = self._indices.view.copy()
+            arrays.update(
+                self._state_fields(self._binning, _unchanged, None)
+            )
+        return arrays
+
+    def save(self, file):
+        """
+        Save the window and the bin state of the hist to a binary .npz file,
+        to be loaded by restore().
+
+        Parameters
+        ----------
+        file : str or file
+            File name or open binary file to write to.
+        """
+        np.savez(file, **self.checkpoint())
+
+    def restore(self, file):
+        """
+        Replace the contents of the hist with those saved by save().
+
+        The bin state is loaded as saved if it was saved with the current
+        bins, so a restore costs little more than reading the file. Otherwise
+        it is rebuilt from the saved samples. Hists in decay mode keep no
+        samples, so their bin state is cleared if the bins differ.
+
+        Parameters
+        ----------
+        file : str or file
+            File name or open binary file to read from.
+        """
+        with np.load(file, allow_pickle=False) as saved:
+            self._restore(dict(saved))
+
+    def _restore(self, saved):
+        if self._weights is not None and 'weights' not in saved:
+            raise ValueError("Checkpoint has no weights")
+        self._version += 1
+        self._data.clear()
+        self._data.extend(saved['data'].astype(self._data.dtype))
+        if self._weights is not None:
+            self._weights.clear()
+            self._weights.extend(saved['weights'].astype(self._weights.dtype))
+        if self._extrema is not None:
+            self._extrema.clear()
+            self._extrema.extend(self._data.view)
+            self._binning = self._auto_binning()
+        if not self._saved_state_matches(saved):
+            self._rebin()
+            return
+        self._indices = RingBuffer(
+            self._data.maxlen,
+            dtype=_int_dtype(self._binning.nbins)
+        )
+        self._indices.extend(saved['indices'])
+        self._reset()
+        self._load_state(saved)
+        self._evicted = 0
+
+    def _saved_state_matches(self, saved):
+        """
+        Whether the bin state of a checkpoint applies to this hist as is.
+        """
+        if not self.incremental or 'indices' not in saved:
+            return False
+        if np.isnan(saved['decay']) != (self.decay is None):
+            return False
+        if not len(saved['indices']) == len(saved['data']) <= len(self._data):
+            return False
+        edges = _edge_arrays(self._binning)
+        return all(
+            np.array_equal(saved.get('edges_{}'.format(axis)), axis_edges)
+            for axis, axis_edges in enumerate(edges)
+        )
+
+    def _load_state(self, saved):
+        """
+        Load the incrementally maintained state from a checkpoint.
+        """
+        self._counts[...] = saved['counts']
+
+    def push(self, data):
+        """
+        Parameters
+        ----------
+        data : float, int or iterable
+            Append these elements to the data for this hist.
+        """
+        self._extend(np.ravel(data))
+
+    @_memoized
+    def hist(self, bins=None, density=False, *, out=None):
+        """
+        Parameters
+        ---------
+        bins : int, iterable, Binning or None
+            Force binning on this hist. Defaults to binning set at class
+            instantiation if this is left as None. Argument follows
+            np.histogram's rules for 'bins' argument.
+
+        density : bool
+            Follows np.histogram's rules for 'density' argument.
+
+        out : numpy.ndarray or None
+            Array to write the histogram into instead of allocating a new
+            one. Results written into out are not cached.
+        """
+        self._check_minlen()
+        binning, reduce = self._resolve_binning(bins)
+        if reduce is not None:
+            counts = reduce(self._counts)
+        else:
+            binning = self._window_binning(binning)
+            counts = binning.counts(binning.index(self._data.view))
+        if density:
+            return binning.density(counts, out=out), binning.edges
+        return _store(counts, out), binning.edges
+
+    @_memoized
+    def pyramid(self, bins=None, density=False, factor=2):
+        """
+        Results of hist() over a binning and successively coarser binnings,
+        down to a single bin, for zooming in and out of the histogram.
+
+        Each level merges factor adjacent bins of the level before. Levels
+        of the default bins, or of bins aligned with them, are summed from
+        the incrementally maintained state without touching the window. The
+        pyramid is cached until the next change to the window.
+
+        Parameters
+        ---------
+        bins : int, iterable, Binning or None
+            Binning of the finest level. Defaults to binning set at class
+            instantiation if this is left as None.
+
+        density : bool
+            Follows np.histogram's rules for 'density' argument.
+
+        factor : int
+            Number of bins of each level merged into a bin of the next.
+
+        Returns
+        -------
+        levels : tuple
+            Result of hist() for each level, finest first.
+        """
+        if factor < 2:
+            raise ValueError("Levels must merge at least two bins")
+        binning, _ = self._resolve_binning(bins)
+        binning = self._window_binning(binning)
+        levels = [self.hist(binning, density=density)]
+        while binning.nbins > 1:
+            binning = binning.coarsen(factor)
+            levels.append(self.hist(binning, density=density))
+        return tuple(levels)
+
+    @property
+    def data(self):
+        """
+        Read-only view of the data in the rolling window, oldest first. The
+        view is only valid until the next push.
+        """
+        return self._data.view
+
+
+class RapidWeightHist(RapidHist):
+    """
+    Weighted rolling histogram. The per-bin sums of the weights are
+    maintained incrementally alongside the bin counts.
+
+    With channels, every sample carries a weight for each channel, such as
+    the readings of several detectors. The data is stored and binned once
+    for all channels. The weights of every channel are kept in one columnar
+    buffer, and the per-bin sums of all channels are updated with a single
+    bincount on each push.
+    """
+    def __init__(self, maxlen, minlen=None, bins=None, decay=None,
+                 dtype=None, weight_dtype=None, channels=None):
+        """
+        Parameters
+        ----------
+        maxlen : int or None
+            Maximum number of data points for hist. Unused in decay mode.
+
+        minlen : int or None
+            Minimum number of data points for hist. Causes error to be thrown.
+            In decay mode this applies to the decayed total of the counts.
+
+        bins : int, iterable, Binning or None
+            Set up default bins for the hist following np.histogram rules for
+            'bins' argument. Must have a range in decay mode.
+
+        decay : float or None
+            Factor between 0 and 1 applied to the bin totals on every push.
+            Enables decay mode when given.
+
+        dtype : numpy.dtype or None
+            Type the data is stored as. Defaults to float64.
+
+        weight_dtype : numpy.dtype or None
+            Type the weights are stored as, such as float32 or uint16 for
+            integer detector readings. Defaults to dtype. Weights are counted
+            as stored, so an integer type truncates fractional weights and
+            raises a ValueError on weights it can not hold. The per-bin sums
+            are always accumulated in float64.
+
+        channels : int or None
+            Number of weights of each sample. If given, weights are pushed
+            with shape (len(data), channels) and hist() returns sums with
+            shape (bins, channels).
+        """
+        self.channels = channels
+        if weight_dtype is None:
+            weight_dtype = float if dtype is None else dtype
+        self._weights = RingBuffer(
+            self._capacity(maxlen, decay),
+            dtype=weight_dtype,
+            columns=self.channels
+        )
+        self._sums = None
+        super().__init__(
+            maxlen=maxlen,
+            minlen=minlen,
+            bins=bins,
+            decay=decay,
+            dtype=dtype,
+        )
+
+    def _rebin(self):
+        super()._rebin()
+        if not self.incremental:
+            self._sums = None
+
+    def _reset(self):
+        super()._reset()
+        if self.channels is None:
+            shape = self._binning.nbins
+        else:
+            shape = (self._binning.nbins, self.channels)
+        self._sums = np.zeros(shape, dtype=float)
+
+    def _add(self, indices, weights, sign):
+        super()._add(indices, weights, sign)
+        sums = self._binning.counts(indices, weights)
+        if sign > 0:
+            self._sums += sums
+        else:
+            self._sums -= sums
+            self._sums[self._counts == 0] = 0
+
+    def _scale(self, factor):
+        super()._scale(factor)
+        self._sums *= factor
+
+    def push(self, data, weights):
+        """
+        Parameters
+        ----------
+        data : float, int or iterable
+            Append these elements to the data for this hist. Must have the same
+            length as weights.
+
+        weights : float, int or iterable
+            Append these elements to the weights for this hist. Must have the
+            same length as data, and shape (len(data), channels) for a hist
+            with channels.
+        """
+        data = np.ravel(data)
+        if self.channels is None:
+            weights = np.ravel(weights)
+            if len(data) != len(weights):
+                raise Exception("Data, weights lengths differ")
+        else:
+            weights = np.asarray(weights)
+            if weights.ndim == 1 and len(weights) == self.channels:
+                weights = weights[np.newaxis]
+            if weights.shape != (len(data), self.channels):
+                raise Exception(
+                    "Weights must have shape (len(data), channels)"
+                )
+        self._extend(data, weights)
+
+    def _state_fields(self, binning, reduce, indices):
+        fields = super()._state_fields(binning, reduce, indices)
+        if reduce is not None:
+            fields['sums'] = np.array(reduce(self._sums))
+        else:
+            fields['sums'] = binning.counts(indices, self._weights.view)
+        return fields
+
+    def _load_state(self, saved):
+        super()._load_state(saved)
+        self._sums[...] = saved['sums']
+
+    @property
+    def weights(self):
+        """
+        Read-only view of the weights in the rolling window, oldest first. The
+        view is only valid until the next push.
+        """
+        return self._weights.view
+
+    @_memoized
+    def hist(self, bins=None, density=False, *, out=None):
+        self._check_minlen()
+        binning, reduce = self._resolve_binning(bins)
+        if reduce is not None:
+            sums = reduce(self._sums)
+        else:
+            binning = self._window_binning(binning)
+            sums = binning.counts(
+                binning.index(self._data.view),
+                self._weights.view
+            )
+        if density:
+            return binning.density(sums, out=out), binning.edges
+        return _store(sums, out), binning.edges
+
+
+class RapidTransmissionHist(RapidWeightHist):
+    """
+    Rolling histogram of the incident counts and the transmitted weights
+    against the same binning, along with their ratio.
+
+    The data and weights are stored once and each sample is binned once on
+    push. The incident counts and outgoing sums both come from that single
+    pass.
+
+    The per-bin sums of squares of the weights are maintained alongside, so
+    the mean, variance and standard error of the transmission in each bin
+    are available from moments() without rescanning the window. The squares
+    are taken about a reference weight, updated whenever the sums are
+    rebuilt, to limit cancellation in the variance.
+
+    Bootstrap confidence bands of the transmission are available from
+    confidence(), computed within a time budget and cached until enough new
+    samples arrive.
+    """
+    # Number of resampled samples drawn at once by confidence()
+    bootstrap_batch = 2**20
+
+    def __init__(self, maxlen, minlen=None, bins=None, decay=None,
+                 dtype=None, weight_dtype=None):
+        self._sumsq = None
+        self._shift = None
+        # Reusable mask of the bins with counts for the ratio
+        self._nonzero = None
+        # Samples pushed so far and the confidence bands computed at
+        self._received = 0
+        self._bands = {}
+        self.random_state = np.random.RandomState()
+        super().__init__(
+            maxlen=maxlen,
+            minlen=minlen,
+            bins=bins,
+            decay=decay,
+            dtype=dtype,
+            weight_dtype=weight_dtype,
+        )
+
+    def _rebin(self):
+        super()._rebin()
+        if not self.incremental:
+            self._sumsq = None
+
+    def _extend(self, data, weights=None):
+        self._received += len(data)
+        super()._extend(data, weights)
+
+    def _resync(self):
+        self._shift = None
+        super()._resync()
+
+    def _reset(self):
+        super()._reset()
+        self._sumsq = np.zeros_like(self._sums)
+
+    def _add(self, indices, weights, sign):
+        super()._add(indices, weights, sign)
+        if self._shift is None:
+            if len(weights) == 0:
+                return
+            # Only reached with an empty window, reference the first weights
+            self._shift = np.asarray(weights).mean(axis=0)
+        squares = self._binning.counts(
+            indices,
+            np.square(np.asarray(weights) - self._shift)
+        )
+        if sign > 0:
+            self._sumsq += squares
+        else:
+            self._sumsq -= squares
+            self._sumsq[self._counts == 0] = 0
+
+    def _scale(self, factor):
+        super()._scale(factor)
+        self._sumsq *= factor
+
+    def _state_fields(self, binning, reduce, indices):
+        fields = super()._state_fields(binning, reduce, indices)
+        if reduce is not None:
+            fields['sumsq'] = np.array(reduce(self._sumsq))
+            fields['shift'] = 0.0 if self._shift is None else self._shift
+        else:
+            weights = self._weights.view
+            shift = weights.mean(axis=0) if len(weights) else 0.0
+            fields['sumsq'] = binning.counts(
+                indices,
+                np.square(weights - shift)
+            )
+            fields['shift'] = shift
+        return fields
+
+    def _load_state(self, saved):
+        super()._load_state(saved)
+        self._sumsq[...] = saved['sumsq']
+        # An empty hist takes its reference from the next weights pushed
+        self._shift = saved['shift'] if self._counts.any() else None
+
+    @_memoized
+    def moments(self, bins=None):
+        """
+        Per-bin statistics of the weights of the samples in the window.
+
+        Parameters
+        ---------
+        bins : int, iterable, Binning or None
+            Force binning on this hist. Defaults to binning set at class
+            instantiation if this is left as None. Argument follows
+            np.histogram's rules for 'bins' argument.
+
+        Returns
+        -------
+        inc : numpy.ndarray
+            Number of incident samples in each bin.
+
+        mean : numpy.ndarray
+            Mean transmission in each bin, nan for empty bins.
+
+        variance : numpy.ndarray
+            Sample variance of the transmission in each bin, nan for bins
+            with fewer than two samples.
+
+        sem : numpy.ndarray
+            Standard error of the mean transmission in each bin, nan for
+            bins with fewer than two samples.
+
+        bins : numpy.ndarray
+            Bin edges.
+        """
+        self._check_minlen()
+        binning, reduce = self._resolve_binning(bins)
+        if reduce is not None:
+            inc = _widen(reduce(self._counts))
+            sums = reduce(self._sums)
+            sumsq = reduce(self._sumsq)
+            shift = 0.0 if self._shift is None else self._shift
+        else:
+            binning = self._window_binning(binning)
+            indices = binning.index(self._data.view)
+            weights = self._weights.view
+            shift = weights.mean(axis=0) if len(weights) else 0.0
+            inc = binning.counts(indices)
+            sums = binning.counts(indices, weights)
+            sumsq = binning.counts(indices, np.square(weights - shift))
+        mean, variance, sem = _moments(inc, sums, sumsq, shift)
+        return inc, mean, variance, sem, binning.edges
+
+    @_memoized
+    def hist(self, bins=None, density=False, *, out=None):
+        """
+        Parameters
+        ---------
+        bins : int, iterable, Binning or None
+            Force binning on this hist. Defaults to binning set at class
+            instantiation if this is left as None. Argument follows
+            np.histogram's rules for 'bins' argument.
+
+        density : bool
+            Follows np.histogram's rules for 'density' argument, applied to
+            the incident and outgoing histograms separately.
+
+        out : (numpy.ndarray, numpy.ndarray, numpy.ndarray) or None
+            Float arrays to write inc, outgoing and fractional_yield into
+            instead of allocating new ones. With the default bins, a call
+            with out does no allocations proportional to the window or the
+            bins. Results written into out are not cached.
+
+        Returns
+        -------
+        inc : numpy.ndarray
+            Number of incident samples in each bin.
 
-    def hist(self):
-        raise NotImplementedError
+        outgoing : numpy.ndarray
+            Sum of the weights in each bin.
 
-    @property
-    def data(self):
-        raise NotImplementedError
+        fractional_yield : numpy.ndarray
+            Ratio of outgoing to inc, zero for empty bins.
 
-    @data.setter
-    def data(self):
-        raise NotImplementedError
+        bins : numpy.ndarray
+            Bin edges.
+        """
+        self._check_minlen()
+        binning, reduce = self._resolve_binning(bins)
+        inc_out, outgoing_out, yield_out = (None,) * 3 if out is None else out
+        if reduce is not None:
+            inc = reduce(self._counts)
+            outgoing = reduce(self._sums)
+        else:
+            binning = self._window_binning(binning)
+            indices = binning.index(self._data.view)
+            inc = binning.counts(indices)
+            outgoing = binning.counts(indices, self._weights.view)
+        if density:
+            inc = binning.density(inc, out=inc_out)
+            outgoing = binning.density(outgoing, out=outgoing_out)
+        else:
+            inc = _store(inc, inc_out)
+            outgoing = _store(outgoing, outgoing_out)
+        # Divide in place, only where there are counts
+        if yield_out is None:
+            fractional_yield = np.zeros(outgoing.shape)
+        else:
+            fractional_yield = yield_out
+            fractional_yield.fill(0)
+        if self._nonzero is None or self._nonzero.shape != inc.shape:
+            self._nonzero = np.empty(inc.shape, dtype=bool)
+        np.not_equal(inc, 0, out=self._nonzero)
+        np.divide(
+            outgoing,
+            inc,
+            out=fractional_yield,
+            where=self._nonzero,
+        )
+        return inc, outgoing, fractional_yield, binning.edges
 
 
-class RapidHist(BaseHist):
+    def _bootstrap(self, indices, weights, nbins, resamples, budget):
+        """
+        Fractional yield of each bin in bootstrap resamples of the window,
+        drawn in batches until resamples are done or budget runs out.
+        """
+        size = len(indices)
+        # Samples outside the bins go to an overflow bin after the last
+        indices = np.where(indices < 0, nbins, indices).astype(np.intp)
+        batch = max(1, self.bootstrap_batch // size)
+        start = time.perf_counter()
+        yields = []
+        done = 0
+        while done < resamples:
+            count = min(batch, resamples - done)
+            draws = self.random_state.randint(0, size, size=(count, size))
+            # Offset the bins of each resample so one bincount does them all
+            flat = (
+                indices[draws]
+                + (nbins + 1) * np.arange(count)[:, np.newaxis]
+            ).ravel()
+            shape = (count, nbins + 1)
+            inc = np.bincount(flat, minlength=count * (nbins + 1))
+            outgoing = np.bincount(
+                flat,
+                weights=weights[draws].ravel(),
+                minlength=count * (nbins + 1),
+            )
+            with np.errstate(divide='ignore', invalid='ignore'):
+                yields.append(
+                    (outgoing.reshape(shape) / inc.reshape(shape))[:, :nbins]
+                )
+            done += count
+            if budget is not None and time.perf_counter() - start > budget:
+                break
+        return np.concatenate(yields)
+
+    def confidence(self, bins=None, level=0.68, resamples=200, budget=0.1,
+                   refresh=None):
+        """
+        Bootstrap confidence band of the fractional yield of each bin.
+
+        The window is resampled with replacement, many resamples at a time,
+        reusing the bin index of every sample. The band is cached and only
+        recomputed once refresh new samples have been pushed.
+
+        Parameters
+        ---------
+        bins : int, iterable, Binning or None
+            Force binning on this hist. Defaults to binning set at class
+            instantiation if this is left as None.
+
+        level : float
+            Confidence level of the band, between 0 and 1.
+
+        resamples : int
+            Number of bootstrap resamples.
+
+        budget : float or None
+            Seconds to spend resampling. The band is computed from the
+            resamples done when the budget runs out, checked after each
+            batch of resamples. None to always do all of them.
+
+        refresh : int or None
+            Number of new samples after which a cached band is recomputed.
+            Defaults to a tenth of maxlen.
+
+        Returns
+        -------
+        lower : numpy.ndarray
+            Lower limit of the band, nan for empty bins.
+
+        upper : numpy.ndarray
+            Upper limit of the band, nan for empty bins.
+
+        resamples : int
+            Number of resamples the band was computed from.
+
+        bins : numpy.ndarray
+            Bin edges.
+        """
+        if self.decay is not None:
+            raise Exception("Decaying hists keep no samples to resample")
+        if not 0 < level < 1:
+            raise ValueError("Confidence level must be in (0, 1)")
+        self._check_minlen()
+        binning, reduce = self._resolve_binning(bins)
+        key = (binning._key(), level, resamples)
+        if refresh is None:
+            refresh = max(1, self._data.maxlen // 10)
+        cached = self._bands.get(key)
+        if cached is not None and self._received - cached[0] < refresh:
+            return cached[1]
+        if reduce is _unchanged:
+            indices = self._indices.view
+        else:
+            binning = self._window_binning(binning)
+            indices = binning.index(self._data.view)
+        if len(indices) == 0:
+            lower = upper = np.full(binning.nbins, np.nan)
+            done = 0
+        else:
+            yields = self._bootstrap(
+                indices,
+                self._weights.view,
+                binning.nbins,
+                resamples,
+                budget,
+            )
+            done = len(yields)
+            with warnings.catch_warnings():
+                # Empty bins have no yield in any resample
+                warnings.simplefilter('ignore', RuntimeWarning)
+                lower, upper = np.nanpercentile(
+                    yields,
+                    [50 * (1 - level), 50 * (1 + level)],
+                    axis=0
+                )
+        result = _freeze((lower, upper, done, binning.edges))
+        self._bands[key] = (self._received, result)
+        if len(self._bands) > self.cache_size:
+            del self._bands[next(iter(self._bands))]
+        return result
+
+
+class RapidHistBank(RapidWeightHist):
     """
-    Wrapper on np.histogram for rapidly regenerating histograms of dynamic data
+    Bank of weighted rolling histograms of several channels sharing the same
+    data and binning. A RapidWeightHist which always has channels.
+    """
+    def __init__(self, maxlen, channels, minlen=None, bins=None, decay=None,
+                 dtype=None, weight_dtype=None):
+        super().__init__(
+            maxlen=maxlen,
+            minlen=minlen,
+            bins=bins,
+            decay=decay,
+            dtype=dtype,
+            weight_dtype=weight_dtype,
+            channels=channels,
+        )
+
+
+class Hist2DMixin:
+    """
+    Turn a rolling histogram of one dimensional samples into one of pairs of
+    samples, binned by a Binning2D.
+
+    The two dimensional counts are maintained incrementally as a flat array
+    in the same way as the one dimensional ones, so the cost of a push does
+    not depend on the length of the window. Axes without a range span the
+    extremes of the window, tracked on push, and the window is only binned
+    again when they move.
+    """
+    _binning_type = Binning2D
+    _data_columns = 2
+
+    def _running_extrema(self):
+        return ColumnExtrema(self._data.maxlen, self._data_columns)
+
+    def _auto_binning(self):
+        window_range = self._extrema.range
+        if window_range is None:
+            return self._auto_bins
+        axes = []
+        for axis, lower, upper in zip(
+            (self._auto_bins.x, self._auto_bins.y),
+            *window_range
+        ):
+            if axis.edges is None:
+                axis = Binning(axis.nbins, range=_auto_range(lower, upper))
+            axes.append(axis)
+        return Binning2D(axes)
+
+    def _window_binning(self, binning):
+        """
+        Give the axes of a binning without a range the range of the data in
+        the window.
+        """
+        if binning.edges is not None:
+            return binning
+        axes = []
+        for axis, column in zip((binning.x, binning.y), self._data.view.T):
+            if axis.edges is None:
+                axis = np.histogram_bin_edges(column, bins=axis.nbins)
+            axes.append(axis)
+        return Binning2D(axes)
+
+    def _pairs(self, x, y):
+        x = np.ravel(x)
+        y = np.ravel(y)
+        if len(x) != len(y):
+            raise Exception("X, y lengths differ")
+        return np.column_stack((x, y))
+
+    @_memoized
+    def hist(self, bins=None, density=False):
+        """
+        Parameters
+        ---------
+        bins : int, iterable, Binning2D or None
+            Force binning on this hist. Defaults to binning set at class
+            instantiation if this is left as None. Argument follows
+            np.histogram2d's rules for 'bins' argument.
+
+        density : bool
+            Follows np.histogram2d's rules for 'density' argument.
+
+        Returns
+        -------
+        hist : numpy.ndarray
+            Two dimensional histogram with x along the first axis.
+
+        xedges : numpy.ndarray
+            Bin edges along x.
+
+        yedges : numpy.ndarray
+            Bin edges along y.
+        """
+        self._check_minlen()
+        binning, reduce = self._resolve_binning(bins)
+        if reduce is not None:
+            counts = _widen(reduce(self._totals()))
+        else:
+            binning = self._window_binning(binning)
+            counts = binning.counts(
+                binning.index(self._data.view),
+                None if self._weights is None else self._weights.view
+            )
+        if density:
+            counts = binning.density(counts)
+        xedges, yedges = binning.edges
+        return counts.reshape(binning.shape), xedges, yedges
+
+
+class RapidHist2D(Hist2DMixin, RapidHist):
+    """
+    Rolling two dimensional histogram, such as incident energy against
+    transmitted intensity.
+    """
+    def __init__(self, maxlen, minlen=None, bins=None, decay=None,
+                 dtype=None):
+        """
+        Parameters
+        ----------
+        maxlen : int or None
+            Maximum number of data points for hist. Unused in decay mode.
+
+        minlen : int or None
+            Minimum number of data points for hist. Causes error to be thrown.
+
+        bins : int, iterable, Binning2D or None
+            Set up default bins for the hist following np.histogram2d rules
+            for 'bins' argument.
+
+        decay : float or None
+            Factor between 0 and 1 applied to the bin totals on every push.
+            Enables decay mode when given.
+
+        dtype : numpy.dtype or None
+            Type the data is stored as. Defaults to float64.
+        """
+        super().__init__(
+            maxlen=maxlen,
+            minlen=minlen,
+            bins=bins,
+            decay=decay,
+            dtype=dtype,
+        )
+
+    def _totals(self):
+        return self._counts
+
+    def push(self, x, y):
+        """
+        Parameters
+        ----------
+        x : float, int or iterable
+            Append these elements to the x data for this hist.
+
+        y : float, int or iterable
+            Append these elements to the y data for this hist. Must have the
+            same length as x.
+        """
+        self._extend(self._pairs(x, y))
+
+
+class RapidWeightHist2D(Hist2DMixin, RapidWeightHist):
+    """
+    Rolling two dimensional weighted histogram.
+    """
+    def __init__(self, maxlen, minlen=None, bins=None, decay=None,
+                 dtype=None, weight_dtype=None):
+        super().__init__(
+            maxlen=maxlen,
+            minlen=minlen,
+            bins=bins,
+            decay=decay,
+            dtype=dtype,
+            weight_dtype=weight_dtype,
+        )
+
+    def _totals(self):
+        return self._sums
+
+    def push(self, x, y, weights):
+        """
+        Parameters
+        ----------
+        x : float, int or iterable
+            Append these elements to the x data for this hist.
+
+        y : float, int or iterable
+            Append these elements to the y data for this hist. Must have the
+            same length as x.
+
+        weights : float, int or iterable
+            Append these elements to the weights for this hist. Must have the
+            same length as x.
+        """
+        data = self._pairs(x, y)
+        weights = np.ravel(weights)
+        if len(data) != len(weights):
+            raise Exception("Data, weights lengths differ")
+        self._extend(data, weights)
+
+
+class RapidSparseHist(BaseHist):
+    """
+    Rolling histogram over unbounded uniform bins which only stores the
+    occupied bins.
+
+    Bin k spans [origin + k * width, origin + (k + 1) * width). The numbers
+    and counts of the occupied bins are kept as a pair of sorted arrays and
+    updated incrementally on push and eviction, so memory and the cost of
+    a push depend on the number of occupied bins and not on the span of the
+    data. Dense counts are only made for the range asked of hist(), such as
+    the part of the axis that is on screen.
     """
-    def __init__(self, maxlen, minlen=None, bins=None):
+    # Bin number of non-finite samples, which are not counted
+    _missing = np.iinfo(np.int64).min
+    # Largest number of bins hist() spans without an explicit range
+    max_bins = 10000
+
+    def __init__(self, maxlen, width, origin=0.0, minlen=None, dtype=None):
         """
         Parameters
         ----------
         maxlen : int
             Maximum number of data points for hist.
 
+        width : float
+            Width of the bins.
+
+        origin : float
+            An edge of the bins.
+
         minlen : int or None
             Minimum number of data points for hist. Causes error to be thrown.
 
-        bins : int, iterable or None
-            Set up default bins for the hist following np.histogram rules for
-            'bins' argument.
+        dtype : numpy.dtype or None
+            Type the data is stored as. Defaults to float64.
         """
-        self._data = deque(maxlen=maxlen)
-        if bins is None:
-            self.bins = 10
-        else:
-            self.bins = bins
+        if not width > 0:
+            raise ValueError("Bin width must be positive")
+        self.width = float(width)
+        self.origin = float(origin)
         self.minlen = minlen
+        self._data = RingBuffer(
+            maxlen,
+            dtype=float if dtype is None else dtype
+        )
+        # Bin number of each sample in self._data
+        self._numbers = RingBuffer(maxlen, dtype=np.int64)
+        # Sorted numbers of the occupied bins and their counts
+        self._occupied = np.empty(0, dtype=np.int64)
+        self._counts = np.empty(0, dtype=_int_dtype(maxlen))
+        self._version = 0
+
+    @property
+    def version(self):
+        """
+        Counter bumped on every change to the window.
+        """
+        return self._version
+
+    def _number(self, data):
+        """
+        Bin number of each sample.
+        """
+        with np.errstate(invalid='ignore'):
+            numbers = np.floor((data - self.origin) / self.width)
+        finite = np.isfinite(numbers)
+        numbers[~finite] = 0
+        numbers = numbers.astype(np.int64)
+        numbers[~finite] = self._missing
+        return numbers
+
+    def _add(self, numbers, sign):
+        """
+        Add (sign=1) or remove (sign=-1) samples with these bin numbers from
+        the occupied bins.
+        """
+        numbers, counts = np.unique(
+            numbers[numbers != self._missing],
+            return_counts=True
+        )
+        if len(numbers) == 0:
+            return
+        position = np.searchsorted(self._occupied, numbers)
+        if sign < 0:
+            # Evicted samples are always in occupied bins
+            self._counts[position] -= counts.astype(self._counts.dtype)
+            occupied = self._counts != 0
+            if not occupied.all():
+                self._occupied = self._occupied[occupied]
+                self._counts = self._counts[occupied]
+            return
+        found = position < len(self._occupied)
+        found[found] = self._occupied[position[found]] == numbers[found]
+        self._counts[position[found]] += counts[found].astype(
+            self._counts.dtype
+        )
+        new = ~found
+        if new.any():
+            self._occupied = np.insert(
+                self._occupied,
+                position[new],
+                numbers[new]
+            )
+            self._counts = np.insert(
+                self._counts,
+                position[new],
+                counts[new]
+            )
+
+    def _extend(self, data):
+        self._version += 1
+        data = np.asarray(data, dtype=self._data.dtype)
+        self._data.extend(data)
+        numbers = self._number(data)
+        self._add(self._numbers.extend(numbers), -1)
+        self._add(numbers[-self._data.maxlen:], 1)
+
+    def _popleft(self, n):
+        self._version += 1
+        self._data.popleft(n)
+        self._add(self._numbers.popleft(n), -1)
 
     def push(self, data):
         """
@@ -50,148 +2417,275 @@ class RapidHist(BaseHist):
         data : float, int or iterable
             Append these elements to the data for this hist.
         """
-        try:
-            self._data.extend(data)
-        except TypeError:
-            self._data.append(data)
+        self._extend(np.ravel(data))
 
-    def hist(self, bins=None, density=False):
+    @property
+    def occupied(self):
+        """
+        Lower edges and counts of the occupied bins, in order.
+        """
+        return (
+            self.origin + self._occupied * self.width,
+            _widen(self._counts),
+        )
+
+    def hist(self, range=None, density=False):
         """
         Parameters
         ---------
-        bins : int, iterable or None
-            Force binning on this hist. Defaults to binning set at class
-            instantiation if this is left as None. Argument follows
-            np.histogram's rules for 'bins' argument.
+        range : (float, float) or None
+            Lower and upper limits of the dense histogram, widened to the
+            edges of the bins they fall in. Defaults to the span of the
+            occupied bins, which must then be at most max_bins bins so a
+            stray outlier can not blow up the dense histogram.
 
         density : bool
-            Follows np.histogram's rules for 'density' argument.
+            Follows np.histogram's rules for 'density' argument, normalized
+            over the bins in range.
+
+        Returns
+        -------
+        hist : numpy.ndarray
+            Counts of the bins in range.
+
+        bins : numpy.ndarray
+            Bin edges.
         """
-        if bins is None:
-            bins = self.bins
-        if self.minlen is not None:
-            if len(self._data) < self.minlen:
-                raise Exception("Insufficient data")
-        return np.histogram(self._data, bins=bins, density=density)
+        if self.minlen is not None and len(self._data) < self.minlen:
+            raise Exception("Insufficient data")
+        if range is None:
+            if len(self._occupied) == 0:
+                first, last = 0, 1
+            else:
+                first = self._occupied[0]
+                last = self._occupied[-1] + 1
+                if last - first > self.max_bins:
+                    raise ValueError(
+                        "Occupied bins span {} bins, more than max_bins, "
+                        "give a range".format(last - first)
+                    )
+        else:
+            lower, upper = range
+            if not lower < upper:
+                raise ValueError("Range must be increasing")
+            first, = self._number(np.array([lower], dtype=float))
+            last, = self._number(np.array([upper], dtype=float))
+            last = last + (self.origin + last * self.width < upper)
+            last = max(last, first + 1)
+        start, stop = np.searchsorted(self._occupied, [first, last])
+        counts = np.zeros(last - first, dtype=np.intp)
+        counts[self._occupied[start:stop] - first] = self._counts[start:stop]
+        edges = self.origin + np.arange(first, last + 1) * self.width
+        if density:
+            return Binning(edges).density(counts.astype(float)), edges
+        return counts, edges
 
     @property
     def data(self):
-        return np.array(self._data)
+        """
+        Read-only view of the data in the rolling window, oldest first. The
+        view is only valid until the next push.
+        """
+        return self._data.view
 
 
-class RapidWeightHist(RapidHist):
-    def __init__(self, maxlen, minlen=None, bins=None):
-        super().__init__(
-            maxlen=maxlen,
-            minlen=minlen,
-            bins=bins,
-        )
-        self._weights = deque(maxlen=maxlen)
+class TimeWindowMixin:
+    """
+    Evict samples from a rolling histogram by age rather than by count.
 
-    def push(self, data, weights):
-        try:
-            if len(data) is not len(weights):
-                raise Exception("Data, weights lengths differ")
-        except TypeError:
-            pass
-        super().push(data)
-        try:
-            self._weights.extend(weights)
-        except TypeError:
-            self._weights.append(weights)
+    Each push carries the timestamp of every sample. Samples older than
+    horizon relative to the newest timestamp are evicted through the same
+    path as samples pushed out of a full window, so the bin state stays
+    incremental. maxlen remains a hard cap on the number of samples kept.
 
-    @property
-    def weights(self):
-        return np.array(self._weights)
+    The timestamps in the window are kept sorted so the samples to evict are
+    found by binary search. Samples older than the newest one already in the
+    window are dropped on push and counted in late.
+    """
+    def __init__(self, horizon, maxlen, **kwargs):
+        """
+        Parameters
+        ----------
+        horizon : float
+            Age, in the units of the timestamps, beyond which samples are
+            evicted.
 
-    def hist(self, bins=None, density=False):
-        if bins is None:
-            bins = self.bins
-        if self.minlen is not None:
-            if len(self._data) < self.minlen:
-                raise Exception("Insufficient data")
-        return np.histogram(
-            self._data, 
-            weights=self._weights,
-            bins=bins, 
-            density=density
+        maxlen : int
+            Maximum number of data points for hist, regardless of age.
+        """
+        self.horizon = horizon
+        self.late = 0
+        self._timestamps = RingBuffer(maxlen, dtype=float)
+        super().__init__(maxlen=maxlen, **kwargs)
+
+    def _push_timed(self, timestamps, data, weights=None):
+        timestamps = np.ravel(timestamps).astype(float)
+        if len(timestamps) != len(data):
+            raise Exception("Data, timestamps lengths differ")
+        if np.any(np.diff(timestamps) < 0):
+            order = np.argsort(timestamps, kind='mergesort')
+            timestamps = timestamps[order]
+            data = data[order]
+            if weights is not None:
+                weights = weights[order]
+        if len(self._timestamps):
+            late = np.searchsorted(
+                timestamps,
+                self._timestamps.view[-1],
+                side='left'
+            )
+            if late:
+                self.late += int(late)
+                timestamps = timestamps[late:]
+                data = data[late:]
+                if weights is not None:
+                    weights = weights[late:]
+        self._timestamps.extend(timestamps)
+        self._extend(data, weights)
+        self.expire()
+
+    def expire(self, now=None):
+        """
+        Evict the samples older than horizon.
+
+        Parameters
+        ----------
+        now : float or None
+            Time to measure the age of the samples from. Defaults to the
+            newest timestamp in the window. Passing the current time lets
+            the window empty out while no data arrives.
+        """
+        if len(self._timestamps) == 0:
+            return
+        if now is None:
+            now = self._timestamps.view[-1]
+        n = np.searchsorted(
+            self._timestamps.view,
+            now - self.horizon,
+            side='left'
         )
+        self._timestamps.popleft(n)
+        self._popleft(n)
+
+    def checkpoint(self):
+        arrays = super().checkpoint()
+        arrays['timestamps'] = self._timestamps.view.copy()
+        return arrays
+
+    def _restore(self, saved):
+        if 'timestamps' not in saved:
+            raise ValueError("Checkpoint has no timestamps")
+        if self._weights is not None and 'weights' not in saved:
+            raise ValueError("Checkpoint has no weights")
+        self._timestamps.clear()
+        self._timestamps.extend(saved['timestamps'])
+        super()._restore(saved)
+
+    @property
+    def timestamps(self):
+        """
+        Read-only view of the timestamps in the rolling window, oldest first.
+        The view is only valid until the next push.
+        """
+        return self._timestamps.view
 
 
-class RapidTransmissionHist(BaseHist):
-    def __init__(self, maxlen, minlen=None, bins=None):
+class RapidTimeHist(TimeWindowMixin, RapidHist):
+    """
+    RapidHist covering the samples of the last horizon in time.
+    """
+    def __init__(self, horizon, maxlen, minlen=None, bins=None,
+                 dtype=None):
         """
         Parameters
         ----------
+        horizon : float
+            Age, in the units of the timestamps, beyond which samples are
+            evicted.
+
         maxlen : int
-            Maximum number of data points for hist.
+            Maximum number of data points for hist, regardless of age.
 
         minlen : int or None
             Minimum number of data points for hist. Causes error to be thrown.
 
-        bins : int, iterable or None
+        bins : int, iterable, Binning or None
             Set up default bins for the hist following np.histogram rules for
             'bins' argument.
-        """
-        self._data = deque(maxlen=maxlen)
-        if bins is None:
-            self.bins = 10
-        else:
-            self.bins = bins
-        self.minlen = minlen
 
-        # Abbreviation for incedent energy
-        self.inc_hist = RapidHist(
+        dtype : numpy.dtype or None
+            Type the data is stored as. Defaults to float64.
+        """
+        super().__init__(
+            horizon=horizon,
             maxlen=maxlen,
             minlen=minlen,
-            bins=bins
+            bins=bins,
+            dtype=dtype,
         )
 
-        self.outgoing_hist = RapidWeightHist(
+    def push(self, data, timestamps):
+        """
+        Parameters
+        ----------
+        data : float, int or iterable
+            Append these elements to the data for this hist.
+
+        timestamps : float or iterable
+            Time of each element of data. Must have the same length as data.
+        """
+        self._push_timed(timestamps, np.ravel(data))
+
+
+class RapidTimeWeightHist(TimeWindowMixin, RapidWeightHist):
+    """
+    RapidWeightHist covering the samples of the last horizon in time.
+    """
+    def __init__(self, horizon, maxlen, minlen=None, bins=None,
+                 dtype=None, weight_dtype=None):
+        super().__init__(
+            horizon=horizon,
             maxlen=maxlen,
             minlen=minlen,
-            bins=bins
+            bins=bins,
+            dtype=dtype,
+            weight_dtype=weight_dtype,
         )
-    
-    def push(self, data, weights):
+
+    def push(self, data, weights, timestamps):
         """
         Parameters
         ----------
         data : float, int or iterable
-            Append these elements to the data for this hist. Must have the same
-            length as weights.
-        
+            Append these elements to the data for this hist.
+
         weights : float, int or iterable
             Append these elements to the weights for this hist. Must have the
             same length as data.
-        """
-        self.inc_hist.push(data)
-        self.outgoing_hist.push(data,weights)
-
-    @property
-    def data(self):
-        return self.inc_hist.data
 
-    @property
-    def weights(self):
-        return self.outgoing_hist.weights
-
-    def hist(self, bins=None, density=False):
-        if bins is None:
-            bins = self.bins
-        if self.minlen is not None:
-            if len(self.inc_hist._data) < self.minlen:
-                raise Exception("Insufficient data")
-
-        inc, bins = self.inc_hist.hist(bins=bins, density=density)
-        outgoing, _ = self.outgoing_hist.hist(bins=bins, density=density)
-        with np.errstate(divide='ignore',invalid='ignore'):
-            fractional_yield = np.nan_to_num(outgoing / inc)
-            #fractional_yield = outgoing / inc
-    
-        return inc, outgoing, fractional_yield, bins
-        
+        timestamps : float or iterable
+            Time of each element of data. Must have the same length as data.
+        """
+        data = np.ravel(data)
+        weights = np.ravel(weights)
+        if len(data) != len(weights):
+            raise Exception("Data, weights lengths differ")
+        self._push_timed(timestamps, data, weights)
 
-        
 
+class RapidTimeTransmissionHist(TimeWindowMixin, RapidTransmissionHist):
+    """
+    RapidTransmissionHist covering the samples of the last horizon in time.
+    """
+    def __init__(self, horizon, maxlen, minlen=None, bins=None,
+                 dtype=None, weight_dtype=None):
+        super().__init__(
+            horizon=horizon,
+            maxlen=maxlen,
+            minlen=minlen,
+            bins=bins,
+            dtype=dtype,
+            weight_dtype=weight_dtype,
+        )
 
+    push = RapidTimeWeightHist.push
@@ -0,0 +1,87 @@
+"""
+Hand-off of data from Channel Access callback threads to the event loop
+"""
+import logging
+from collections import deque
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+
+class StagingBuffer:
+    """
+    Lock-free single producer, single consumer staging area between the
+    Channel Access callbacks of a PV and the tornado loop.
+
+    The producer appends records to the active one of two deques and the
+    consumer swaps them before draining the retired one. Deque appends and
+    pops, and the swap itself, are atomic under the GIL so the producer
+    never blocks and nothing pushed is lost between a push and a drain. A
+    record appended by a producer that picked up the retired deque just
+    before the swap is left in it and drained on the swap after next.
+
+    Each deque holds at most maxlen records. Records arriving while the
+    active deque is full are dropped and counted so the loss is visible.
+    """
+    def __init__(self, maxlen, fields=1):
+        """
+        Parameters
+        ----------
+        maxlen : int
+            Maximum number of records held between two drains.
+
+        fields : int
+            Number of values in each record, such as 2 for value and
+            timestamp pairs.
+        """
+        self.maxlen = maxlen
+        self.fields = fields
+        self._buffers = (deque(), deque())
+        self._active = 0
+        # Only written by the producer
+        self.received = 0
+        self.dropped = 0
+        # Only written by the consumer
+        self._reported = 0
+
+    def put(self, *record):
+        """
+        Stage a record. Called from the producer thread.
+        """
+        buffer = self._buffers[self._active]
+        if len(buffer) >= self.maxlen:
+            self.dropped += 1
+            return
+        buffer.append(record)
+        self.received += 1
+
+    def drain(self):
+        """
+        Swap the buffers and return the staged records. Called from the
+        consumer thread.
+
+        Returns
+        -------
+        fields : tuple of numpy.ndarray
+            One array per field of the records, oldest record first.
+        """
+        retired = self._buffers[self._active]
+        self._active ^= 1
+        records = []
+        while True:
+            try:
+                records.append(retired.popleft())
+            except IndexError:
+                break
+        dropped = self.dropped
+        if dropped != self._reported:
+            logger.warning(
+                'Dropped {} records while staging, {} in total'.format(
+                    dropped - self._reported, dropped
+                )
+            )
+            self._reported = dropped
+        if not records:
+            return tuple(np.empty(0) for _ in range(self.fields))
+        return tuple(np.array(records, dtype=float).T)
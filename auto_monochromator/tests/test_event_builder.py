@@ -3,7 +3,8 @@ import pandas as pd
 import numpy as np
 from auto_monochromator.rapid_stats import (RapidHist, RapidWeightHist,
     RapidTransmissionHist)
-from auto_monochromator.event_builder import basic_event_builder
+from auto_monochromator.event_builder import (basic_event_builder,
+    StreamingEventBuilder, merge_join, nearest_join, multi_join)
 from collections import deque
 logger = logging.getLogger(__name__)
 
@@ -36,3 +37,134 @@ def test_simple_event_builder():
     assert index_result.all()
     assert col_result.all()
 
+
+
+def test_StreamingEventBuilder():
+    builder = StreamingEventBuilder(['a', 'b'], horizon=5, maxlen=4)
+    builder.push('a', [10, 20, 30], [1, 2, 3])
+    builder.push('b', [200, 100], [2, 1])
+    timestamps, values = builder.build()
+    assert np.all(timestamps == [1, 2])
+    assert np.all(values['a'] == [10, 20])
+    assert np.all(values['b'] == [100, 200])
+    # The partner of a held sample arriving on a later tick is matched
+    builder.push('b', [300], [3])
+    timestamps, values = builder.build()
+    assert np.all(timestamps == [3]) and np.all(values['a'] == [30])
+    assert builder.matched == 3
+    # Unmatched samples are dropped by age and by number
+    builder.push('a', [40, 50], [4, 5])
+    builder.push('b', [1, 2, 3, 4, 5, 6], [11, 12, 13, 14, 15, 16])
+    timestamps, _ = builder.build()
+    assert len(timestamps) == 0
+    assert builder.overflowed == 2
+    assert builder.expired == 2
+    assert builder.pending == {'a': 0, 'b': 4}
+
+
+def test_merge_join():
+    left = np.array([1, 2, 2, 4, 7, 9])
+    right = np.array([0, 2, 3, 4, 4, 9, 10])
+    left_indices, right_indices = merge_join(left, right)
+    assert np.all(left_indices == [1, 3, 5])
+    assert np.all(right_indices == [1, 3, 5])
+    assert np.all(left[left_indices] == right[right_indices])
+    empty, _ = merge_join(left, [])
+    assert len(empty) == 0
+
+
+def test_nearest_join():
+    left = np.array([1.0, 2.0, 2.1, 3.0, 5.0])
+    right = np.array([0.95, 2.04, 2.9, 3.05, 4.0])
+    left_indices, right_indices = nearest_join(left, right, tolerance=0.1)
+    # 2.0 and 2.1 both claim 2.04, which goes to the closer 2.0
+    assert np.all(left_indices == [0, 1, 3])
+    assert np.all(right_indices == [0, 1, 3])
+    left_indices, right_indices = nearest_join(
+        left, right, tolerance=0.11, direction='backward'
+    )
+    assert np.all(left_indices == [0, 2, 3])
+    assert np.all(right_indices == [0, 1, 2])
+    left_indices, right_indices = nearest_join(
+        left, right, tolerance=0.1, direction='forward'
+    )
+    assert np.all(left_indices == [1, 3])
+    assert np.all(right_indices == [1, 3])
+
+
+def test_StreamingEventBuilder_tolerance():
+    builder = StreamingEventBuilder(['a', 'b'], horizon=1, tolerance=1e-3)
+    builder.push('a', [1, 2, 3, 4], [10.0, 10.5, 11.0, 11.5])
+    builder.push('b', [1, 2, 4], [10.0002, 10.4999, 11.5003])
+    timestamps, values = builder.build()
+    assert np.all(timestamps == [10.0, 10.5, 11.5])
+    assert np.all(values['a'] == values['b'])
+    assert builder.batch_stats['events'] == 3
+    assert builder.batch_stats['expired'] == 0
+    builder.push('a', [5], [13.0])
+    builder.build()
+    assert builder.batch_stats['expired'] == 1
+    assert builder.batch_stats['drop_rate'] == 1
+
+
+def test_multi_join():
+    rng = np.random.RandomState(0)
+    streams = [
+        np.sort(rng.choice(100, size=size, replace=False))
+        for size in (80, 30, 60, 90)
+    ]
+    indices = multi_join(*streams)
+    common = streams[0]
+    for timestamps in streams[1:]:
+        common = np.intersect1d(common, timestamps)
+    for timestamps, index in zip(streams, indices):
+        assert np.all(timestamps[index] == common)
+    # Rows with missing values are still dropped
+    series = [pd.Series(timestamps * 1.0, index=timestamps)
+              for timestamps in streams]
+    series[2][common[0]] = np.nan
+    result = basic_event_builder(*series)
+    assert list(result.columns) == [0, 1, 2, 3]
+    assert np.all(result.index == common[1:])
+    assert np.all(result[3] == common[1:])
+
+
+def test_StreamingEventBuilder_watermark():
+    builder = StreamingEventBuilder(['a', 'b'], horizon=10, lateness=1)
+    builder.push('a', [3, 1, 2, 5], [3, 1, 2, 5])
+    builder.push('b', [2, 1], [2, 1])
+    # Events are only emitted once b has advanced past them
+    timestamps, _ = builder.build()
+    assert np.all(timestamps == [1]) and builder.watermark == 1
+    # Out of order arrivals on b are merged in order
+    builder.push('b', [5, 3], [5, 3])
+    assert builder.watermark == 4
+    timestamps, values = builder.build()
+    assert np.all(timestamps == [2, 3])
+    assert np.all(values['a'] == values['b'])
+    assert builder.batch_stats['expired'] == 0
+    # A sample older than the watermark is late
+    builder.push('a', [2.5, 6, 7], [2.5, 6, 7])
+    assert builder.late == 1
+    builder.push('b', [8], [8])
+    timestamps, _ = builder.build()
+    assert np.all(timestamps == [5])
+    # a's unmatched 6 has been passed by both streams and is dropped
+    assert builder.batch_stats['late'] == 1
+    assert builder.batch_stats['expired'] == 1
+    assert builder.pending == {'a': 1, 'b': 1}
+
+
+def test_StreamingEventBuilder_watermark_tolerance():
+    builder = StreamingEventBuilder(['a', 'b'], horizon=10, tolerance=0.1,
+                                    lateness=0)
+    builder.push('a', [2.87], [2.87])
+    builder.push('b', [2.93], [2.93])
+    # a's 2.87 is before ready, b's 2.93 is after it but before the watermark
+    builder.push('a', [3.0], [3.0])
+    builder.push('b', [3.0], [3.0])
+    timestamps, values = builder.build()
+    assert np.allclose(timestamps, [2.87])
+    assert np.allclose(values['b'], [2.93])
+    assert builder.batch_stats['expired'] == 0
+    assert builder.pending == {'a': 1, 'b': 1}
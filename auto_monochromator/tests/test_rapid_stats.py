@@ -1,11 +1,92 @@
 import logging 
 import pandas as pd
 import numpy as np
+import pytest
 from auto_monochromator.rapid_stats import (RapidHist, RapidWeightHist,
-    RapidTransmissionHist)
+    RapidTransmissionHist, RingBuffer, Binning, RapidTimeHist,
+    RapidTimeTransmissionHist, RapidHistBank, RunningExtrema, RapidHist2D,
+    RapidWeightHist2D, HistState, RapidSparseHist, ColumnExtrema)
 from collections import deque
 logger = logging.getLogger(__name__)
 
+def test_Binning_uniform():
+    assert Binning(np.arange(9450, 9550, 1)).uniform
+    assert Binning(5, range=(0, 1)).uniform
+    assert not Binning([0, 1, 3, 7]).uniform
+    assert Binning(10).edges is None
+    assert Binning(4, range=(0, 4)) == Binning(list(range(5)))
+
+
+def test_Binning_copies_edges():
+    edges = np.linspace(0, 1, 6)
+    RapidHist(maxlen=10, bins=edges)
+    assert edges.flags.writeable
+    edges[0] = -1
+    assert Binning(edges).edges[0] == -1
+
+
+def test_Binning_histogram():
+    rng = np.random.RandomState(0)
+    for edges in [np.arange(0, 1, 0.1), np.array([0, 0.1, 0.5, 0.6, 1])]:
+        binning = Binning(edges)
+        data = np.concatenate([rng.uniform(-0.5, 1.5, 1000), edges])
+        weights = rng.normal(size=len(data))
+        hits, bins = binning.histogram(data, weights=weights)
+        target, target_bins = np.histogram(data, bins=edges, weights=weights)
+        assert np.allclose(hits, target)
+        assert np.all(bins == target_bins)
+        assert binning.index([np.nan])[0] == -1
+
+
+def test_RingBuffer_extend():
+    rb = RingBuffer(maxlen=4, dtype=int)
+    expected = deque(maxlen=4)
+    for start in range(0, 40, 3):
+        values = np.arange(start, start + 3)
+        evicted = rb.extend(values)
+        overflow = max(0, len(expected) + len(values) - 4)
+        assert np.all(evicted == np.array(list(expected)[:overflow], dtype=int))
+        expected.extend(values)
+        assert np.all(rb.view == np.array(expected))
+    assert not rb.view.flags.writeable
+    evicted = rb.extend(np.arange(100, 110))
+    assert np.all(evicted == np.array(expected))
+    assert np.all(rb.view == np.arange(106, 110))
+
+
+def test_RingBuffer_columns():
+    rb = RingBuffer(maxlen=3, columns=2)
+    rb.extend(np.array([[0, 1], [2, 3]]))
+    evicted = rb.extend(np.array([[4, 5], [6, 7]]))
+    assert np.all(evicted == np.array([[0, 1]]))
+    assert rb.view.shape == (3, 2)
+    assert np.all(rb.view == np.array([[2, 3], [4, 5], [6, 7]]))
+
+
+def test_RunningExtrema_range():
+    extrema = RunningExtrema(maxlen=4)
+    assert extrema.range is None
+    extrema.extend(np.array([3., 1., 2.]))
+    assert extrema.range == (1., 3.)
+    extrema.extend(np.array([np.nan, 0.5]))
+    assert extrema.range == (0.5, 2.)
+    extrema.popleft(3)
+    assert extrema.range == (0.5, 0.5)
+    extrema.extend(np.arange(10.))
+    assert extrema.range == (6., 9.)
+
+
+def test_ColumnExtrema_range():
+    extrema = ColumnExtrema(maxlen=3, columns=2)
+    assert extrema.range is None
+    extrema.extend([[1., 5.], [2., np.nan], [0., 7.]])
+    lower, upper = extrema.range
+    assert np.all(lower == [0., 5.]) and np.all(upper == [1., 7.])
+    extrema.popleft(1)
+    lower, upper = extrema.range
+    assert np.all(lower == [0., 7.]) and np.all(upper == [0., 7.])
+
+
 def test_RapidHist_push():
     rh = RapidHist(
         maxlen = 5,
@@ -31,6 +112,35 @@ def test_RapidHist_hist():
     assert np.all(bins == np.array(list(range(5))))
 
 
+def test_RapidHist_incremental_hist():
+    rh = RapidHist(
+        maxlen = 50,
+        bins = np.linspace(-2, 2, 9)
+    )
+    rng = np.random.RandomState(0)
+    for size in [1, 7, 30, 49, 120, 3]:
+        rh.push(rng.normal(size=size))
+        hits, bins = rh.hist()
+        target, target_bins = np.histogram(rh.data, bins=np.linspace(-2, 2, 9))
+        assert np.all(hits == target)
+        assert np.all(bins == target_bins)
+    density, _ = rh.hist(density=True)
+    target, _ = np.histogram(rh.data, bins=np.linspace(-2, 2, 9), density=True)
+    assert np.allclose(density, target)
+
+
+def test_RapidHist_set_bins():
+    rh = RapidHist(
+        maxlen = 5,
+        bins = list(range(5))
+    )
+    rh.push(list(range(3))*10)
+    rh.bins = [0, 2, 4]
+    hits, bins = rh.hist()
+    assert np.all(hits == np.array([3,2]))
+    assert np.all(bins == np.array([0,2,4]))
+
+
 def test_RapidWeightHist_push():
     rwh = RapidWeightHist(
         maxlen = 5,
@@ -91,3 +201,488 @@ def test_RapidTransmissionHist_hist():
     #assert np.all(hist == np.array([0, 11, 5, 2]))
     print(type(hist))
     assert np.all(hist == np.array([0, 4, 2, 4]))
+
+
+def test_RapidTransmissionHist_incremental_hist():
+    edges = np.linspace(-2, 2, 9)
+    rth = RapidTransmissionHist(
+        maxlen=40,
+        bins=edges
+    )
+    rng = np.random.RandomState(0)
+    for size in [5, 17, 60, 1, 33]:
+        rth.push(rng.normal(size=size), rng.uniform(size=size))
+        inc, outgoing, hist, bins = rth.hist()
+        target_inc, _ = np.histogram(rth.data, bins=edges)
+        target_out, _ = np.histogram(rth.data, bins=edges, weights=rth.weights)
+        assert np.all(inc == target_inc)
+        assert np.allclose(outgoing, target_out)
+        with np.errstate(divide='ignore', invalid='ignore'):
+            assert np.allclose(hist, np.nan_to_num(target_out / target_inc))
+        assert np.all(bins == edges)
+    # Overriding the bins rebins the window without touching the default
+    inc, _, _, bins = rth.hist(bins=4)
+    assert np.all(inc == np.histogram(rth.data, bins=4)[0])
+    assert np.all(rth.hist()[3] == edges)
+
+
+def test_RapidTimeHist_expire():
+    rth = RapidTimeHist(
+        horizon=1.0,
+        maxlen=100,
+        bins=list(range(5))
+    )
+    rth.push([0, 1, 2, 3], timestamps=[0.0, 0.5, 1.0, 1.5])
+    assert np.all(rth.data == np.array([1, 2, 3]))
+    hits, _ = rth.hist()
+    assert np.all(hits == np.array([0, 1, 1, 1]))
+    rth.expire(now=3.0)
+    assert len(rth.data) == 0
+    hits, _ = rth.hist()
+    assert np.all(hits == 0)
+
+
+def test_RapidTimeHist_late():
+    rth = RapidTimeHist(horizon=1.0, maxlen=100, bins=list(range(10)))
+    rth.push([5, 6], timestamps=[5.0, 6.0])
+    rth.push([4], timestamps=[4.0])
+    assert rth.late == 1
+    rth.push([6.5], timestamps=[6.5])
+    assert np.all(rth.timestamps == [6.0, 6.5])
+    hits, _ = rth.hist()
+    assert np.all(hits == np.histogram([6, 6.5], bins=list(range(10)))[0])
+
+
+def test_RapidTimeTransmissionHist_hist():
+    edges = np.linspace(0, 1, 6)
+    rtth = RapidTimeTransmissionHist(
+        horizon=10,
+        maxlen=50,
+        bins=edges
+    )
+    rng = np.random.RandomState(0)
+    for start in range(0, 60, 6):
+        times = np.arange(start, start + 6, dtype=float)
+        rtth.push(rng.uniform(size=6), rng.uniform(size=6), times)
+        assert rtth.timestamps[0] >= times[-1] - 10
+        inc, outgoing, _, _ = rtth.hist()
+        assert np.all(inc == np.histogram(rtth.data, bins=edges)[0])
+        target_out, _ = np.histogram(rtth.data, bins=edges,
+                                     weights=rtth.weights)
+        assert np.allclose(outgoing, target_out)
+
+
+def test_RapidWeightHist_decay():
+    rwh = RapidWeightHist(
+        maxlen=None,
+        bins=list(range(5)),
+        decay=0.5,
+    )
+    rwh.push([0, 1, 1], [1, 2, 2])
+    rwh.push([3], [4])
+    assert len(rwh.data) == 0
+    hits, bins = rwh.hist()
+    assert np.allclose(hits, np.array([0.5, 2, 0, 4]))
+    assert np.all(bins == np.array(list(range(5))))
+
+
+def test_RapidHist_decay():
+    rh = RapidHist(
+        maxlen=None,
+        minlen=2,
+        bins=list(range(5)),
+        decay=0.5,
+    )
+    rh.push([0, 1, 1])
+    rh.push([3])
+    hits, _ = rh.hist()
+    assert np.allclose(hits, np.array([0.5, 1, 0, 1]))
+    rh.push([])
+    rh.push([])
+    with pytest.raises(Exception):
+        rh.hist()
+
+
+def test_RapidHistBank_hist():
+    edges = np.linspace(0, 1, 6)
+    bank = RapidHistBank(
+        maxlen=30,
+        channels=3,
+        bins=edges
+    )
+    rng = np.random.RandomState(0)
+    for size in [4, 25, 11]:
+        bank.push(rng.uniform(size=size), rng.normal(size=(size, 3)))
+    hits, bins = bank.hist()
+    assert hits.shape == (5, 3)
+    for channel in range(3):
+        target, _ = np.histogram(bank.data, bins=edges,
+                                 weights=bank.weights[:, channel])
+        assert np.allclose(hits[:, channel], target)
+    assert np.all(bins == edges)
+    density, _ = bank.hist(density=True)
+    assert np.allclose((density * np.diff(edges)[:, None]).sum(axis=0), 1)
+
+
+def test_RapidWeightHist_channels():
+    edges = np.linspace(0, 1, 6)
+    rwh = RapidWeightHist(
+        maxlen=20,
+        bins=edges,
+        channels=2,
+        weight_dtype=np.float32
+    )
+    single = RapidWeightHist(maxlen=20, bins=edges)
+    rng = np.random.RandomState(1)
+    for size in [7, 18]:
+        data = rng.uniform(size=size)
+        weights = rng.normal(size=(size, 2))
+        rwh.push(data, weights)
+        single.push(data, weights[:, 1].astype(np.float32))
+    assert rwh.weights.shape == (20, 2)
+    hits, _ = rwh.hist()
+    assert hits.shape == (5, 2)
+    assert np.allclose(hits[:, 1], single.hist()[0])
+    with pytest.raises(Exception):
+        rwh.push([0.5, 0.5], [1, 2])
+
+
+def test_RapidTransmissionHist_moments():
+    edges = np.linspace(0, 1, 5)
+    rth = RapidTransmissionHist(
+        maxlen=60,
+        bins=edges
+    )
+    rng = np.random.RandomState(0)
+    for size in [10, 45, 30]:
+        rth.push(rng.uniform(size=size), 1e6 + rng.normal(size=size))
+    inc, mean, variance, sem, bins = rth.moments()
+    indices = np.digitize(rth.data, edges) - 1
+    for i in range(len(edges) - 1):
+        weights = rth.weights[indices == i]
+        assert inc[i] == len(weights)
+        assert np.isclose(mean[i], weights.mean())
+        assert np.isclose(variance[i], weights.var(ddof=1))
+        assert np.isclose(sem[i], weights.std(ddof=1) / np.sqrt(len(weights)))
+    rth.push([2], [1])
+    variance = rth.moments(bins=[0, 1, 5])[2]
+    assert variance[0] >= 0
+    assert np.isnan(variance[1])
+    assert np.isnan(rth.moments(bins=[0, 1, 2, 5])[1][1])
+
+
+def test_RapidHist_auto_range():
+    rh = RapidHist(maxlen=40, bins=7)
+    rng = np.random.RandomState(0)
+    for size in [1, 1, 12, 40, 5, 90, 3]:
+        rh.push(rng.normal(size=size))
+        hits, bins = rh.hist()
+        target, target_bins = np.histogram(rh.data, bins=7)
+        assert np.all(hits == target)
+        assert np.allclose(bins, target_bins)
+    assert np.all(rh.hist(bins=7)[0] == hits)
+
+
+def test_RapidHist2D_hist():
+    xedges = np.linspace(0, 1, 5)
+    yedges = np.array([-2, -1, 0, 0.5, 2])
+    rh2 = RapidHist2D(
+        maxlen=50,
+        bins=[xedges, yedges]
+    )
+    rng = np.random.RandomState(0)
+    for size in [3, 40, 21]:
+        rh2.push(rng.uniform(size=size), rng.normal(size=size))
+        hits, hx, hy = rh2.hist()
+        target, tx, ty = np.histogram2d(rh2.data[:, 0], rh2.data[:, 1],
+                                        bins=[xedges, yedges])
+        assert np.all(hits == target)
+        assert np.all(hx == tx)
+        assert np.all(hy == ty)
+    hits, _, _ = rh2.hist(bins=3)
+    assert np.all(hits == np.histogram2d(rh2.data[:, 0], rh2.data[:, 1],
+                                         bins=3)[0])
+
+
+def test_RapidHist2D_auto_range():
+    rh2 = RapidHist2D(maxlen=50, bins=(4, [-2, 0, 2]))
+    rng = np.random.RandomState(1)
+    for size in [3, 40, 21, 60]:
+        rh2.push(rng.uniform(size=size) * size, rng.normal(size=size))
+        assert rh2.incremental
+        hits, hx, hy = rh2.hist()
+        target, tx, ty = np.histogram2d(rh2.data[:, 0], rh2.data[:, 1],
+                                        bins=(4, [-2, 0, 2]))
+        assert np.all(hits == target)
+        assert np.allclose(hx, tx) and np.all(hy == ty)
+
+
+def test_RapidWeightHist2D_hist():
+    rwh2 = RapidWeightHist2D(
+        maxlen=20,
+        bins=[list(range(4)), list(range(3))]
+    )
+    rwh2.push([0.5, 0.5, 2.5, 1.5], [0.5, 0.5, 1.5, 9], [1, 2, 4, 8])
+    hits, _, _ = rwh2.hist()
+    assert np.all(hits == np.array([[3, 0], [0, 0], [0, 4]]))
+
+
+def test_RapidTransmissionHist_dtype():
+    edges = np.linspace(0, 1, 11)
+    rth = RapidTransmissionHist(
+        maxlen=1000,
+        bins=edges,
+        dtype=np.float32,
+        weight_dtype=np.uint16,
+    )
+    rng = np.random.RandomState(0)
+    for _ in range(5):
+        rth.push(rng.uniform(size=300), rng.randint(0, 1000, size=300))
+    assert rth.data.dtype == np.float32
+    assert rth.weights.dtype == np.uint16
+    inc, outgoing, _, _ = rth.hist()
+    # Counts are stored compactly but returned widened
+    assert rth._counts.dtype.itemsize <= 2
+    assert inc.dtype == np.intp
+    assert np.all(inc == np.histogram(rth.data, bins=edges)[0])
+    target, _ = np.histogram(rth.data, bins=edges, weights=rth.weights)
+    assert np.allclose(outgoing, target)
+
+
+def test_RapidWeightHist_integer_weights():
+    edges = [0, 1, 2]
+    rwh = RapidWeightHist(maxlen=4, bins=edges, weight_dtype=np.uint16)
+    rth = RapidTransmissionHist(maxlen=4, bins=edges, weight_dtype=np.uint16)
+    for data, weights in [([0.5, 0.5], [1.7, 1.7]),
+                          ([0.5, 1.5, 0.5], [2.2, 3.9, 0.4])]:
+        rwh.push(data, weights)
+        rth.push(data, weights)
+        target, _ = np.histogram(rwh.data, bins=edges, weights=rwh.weights)
+        assert np.allclose(rwh.hist()[0], target)
+        assert np.allclose(rth.hist()[1], target)
+    assert np.allclose(rwh.hist()[0], [3, 3])
+    with pytest.raises(ValueError):
+        rwh.push([0.5], [70000])
+    with pytest.raises(ValueError):
+        rth.push([0.5], [-1])
+    assert np.allclose(rwh.hist()[0], [3, 3])
+
+
+def test_RapidHist_full_window_counts():
+    for maxlen in [128, 32768]:
+        rh = RapidHist(maxlen=maxlen, bins=[0, 1, 2])
+        rh.push(np.full(maxlen, 0.5))
+        hits, _ = rh.hist()
+        assert hits[0] == maxlen
+        assert hits.dtype == np.intp
+        rth = RapidTransmissionHist(maxlen=maxlen, bins=[0, 1, 2])
+        rth.push(np.full(maxlen, 0.5), np.ones(maxlen))
+        inc, _, fractional_yield, _ = rth.hist()
+        assert inc[0] == maxlen and fractional_yield[0] == 1
+        assert rth.moments()[0][0] == maxlen
+
+
+def test_RapidHist_hist_cache():
+    rh = RapidHist(
+        maxlen=10,
+        bins=list(range(5))
+    )
+    rh.push([0, 1, 2])
+    version = rh.version
+    hits, bins = rh.hist()
+    assert not hits.flags.writeable
+    assert rh.hist()[0] is hits
+    assert rh.hist(density=True)[0] is not hits
+    rh.push([3])
+    assert rh.version > version
+    new_hits, _ = rh.hist()
+    assert new_hits is not hits
+    assert np.all(hits == np.array([1, 1, 1, 0]))
+    assert np.all(new_hits == np.array([1, 1, 1, 1]))
+
+
+def test_RapidTransmissionHist_hist_out():
+    edges = np.linspace(0, 1, 5)
+    rth = RapidTransmissionHist(
+        maxlen=20,
+        bins=edges
+    )
+    rth.push([0.1, 0.1, 0.6], [1, 3, 4])
+    out = tuple(np.full(4, np.nan) for _ in range(3))
+    inc, outgoing, hist, bins = rth.hist(out=out)
+    assert inc is out[0] and outgoing is out[1] and hist is out[2]
+    assert np.all(hist == np.array([2, 0, 4, 0]))
+    assert np.all(inc == np.array([2, 0, 1, 0]))
+    assert hist.flags.writeable
+    density, _, _, _ = rth.hist(density=True, out=out)
+    assert np.allclose(density, rth.hist(density=True)[0])
+
+
+def test_HistState_merge():
+    rng = np.random.RandomState(4)
+    data = rng.uniform(0, 1, 300)
+    weights = rng.normal(1e6, 2, 300)
+    edges = np.linspace(0, 1, 6)
+    states = []
+    for start in range(0, 300, 100):
+        rth = RapidTransmissionHist(maxlen=100, bins=edges)
+        rth.push(data[start:start + 100], weights[start:start + 100])
+        states.append(rth.state())
+    left = states[0].merge(states[1]).merge(states[2])
+    right = states[0].merge(states[1].merge(states[2]))
+    whole = RapidTransmissionHist(maxlen=300, bins=edges)
+    whole.push(data, weights)
+    for merged in (left, right):
+        assert np.all(merged.counts == whole.hist()[0])
+        assert np.allclose(merged.hist()[0], whole.hist()[1])
+        for value, target in zip(merged.moments(), whole.moments()):
+            assert np.allclose(value, target)
+        assert merged.extrema[0] == data.min()
+        assert merged.extrema[1] == data.max()
+    with pytest.raises(ValueError):
+        left.merge(RapidHist(maxlen=10, bins=edges[:-1]).state())
+    with pytest.raises(ValueError):
+        left.merge(RapidHist(maxlen=10, bins=edges).state())
+
+
+def test_RapidTransmissionHist_restore(tmpdir):
+    rng = np.random.RandomState(6)
+    edges = np.linspace(0, 1, 6)
+    rth = RapidTransmissionHist(maxlen=50, bins=edges)
+    rth.push(rng.uniform(0, 1, 80), rng.normal(5, 1, 80))
+    path = str(tmpdir.join('hist.npz'))
+    rth.save(path)
+    restored = RapidTransmissionHist(maxlen=50, bins=edges)
+    restored.restore(path)
+    assert np.all(restored.data == rth.data)
+    for value, target in zip(restored.moments(), rth.moments()):
+        assert np.allclose(value, target, equal_nan=True)
+    # Checkpoints saved with other bins are rebinned from the samples
+    rebinned = RapidTransmissionHist(maxlen=50, bins=np.linspace(0, 1, 3))
+    rebinned.restore(path)
+    target = np.histogram(rth.data, bins=np.linspace(0, 1, 3))[0]
+    assert np.all(rebinned.hist()[0] == target)
+    rng_data = rng.uniform(0, 1, 10), rng.normal(5, 1, 10)
+    rth.push(*rng_data)
+    restored.push(*rng_data)
+    for value, target in zip(restored.hist(), rth.hist()):
+        assert np.allclose(value, target)
+
+
+def test_RapidHist_restore_decay(tmpdir):
+    rh = RapidHist(maxlen=None, bins=Binning(4, range=(0, 4)), decay=0.5)
+    rh.push([0, 1, 1])
+    rh.push([3])
+    path = str(tmpdir.join('hist.npz'))
+    rh.save(path)
+    restored = RapidHist(maxlen=None, bins=Binning(4, range=(0, 4)),
+                         decay=0.5)
+    restored.restore(path)
+    assert np.allclose(restored.hist()[0], rh.hist()[0])
+    with pytest.raises(ValueError):
+        RapidTimeHist(horizon=1, maxlen=10).restore(path)
+
+
+def test_Binning_reduction():
+    fine = Binning(12, range=(0, 12))
+    assert fine.reduction(Binning(7, range=(0, 12))) is None
+    assert fine.reduction(Binning([0, 3, 6, 12.5])) is None
+    # Aligned bins need not span the whole range but must share its end
+    assert fine.reduction(Binning([0, 3, 6])) is None
+    reduce = fine.reduction(Binning([2, 3, 6, 12]))
+    assert np.all(reduce(np.arange(12)) == np.array([2, 12, 51]))
+    coarse = fine.coarsen(5)
+    assert np.all(coarse.edges == np.array([0, 5, 10, 12]))
+    assert np.all(fine.reduction(coarse)(np.ones(12)) == [5, 5, 2])
+
+
+def test_RapidWeightHist_coarse_bins():
+    rng = np.random.RandomState(8)
+    data = rng.uniform(0, 1, 200)
+    weights = rng.normal(3, 1, 200)
+    fine = np.linspace(0, 1, 101)
+    rwh = RapidWeightHist(maxlen=200, bins=fine)
+    rwh.push(data, weights)
+    for coarse in (fine[::10], fine[40::5], Binning(4, range=(0, 1))):
+        hist, edges = rwh.hist(bins=coarse)
+        target, _ = np.histogram(data, bins=edges, weights=weights)
+        assert np.allclose(hist, target)
+    levels = rwh.pyramid()
+    assert rwh.pyramid() is levels
+    assert [len(hist) for hist, _ in levels] == [100, 50, 25, 13, 7, 4, 2, 1]
+    for hist, edges in levels:
+        target, _ = np.histogram(data, bins=edges, weights=weights)
+        assert np.allclose(hist, target)
+    decaying = RapidHist(maxlen=None, bins=fine, decay=0.5)
+    decaying.push(data)
+    assert np.allclose(decaying.hist(bins=fine[::20])[0],
+                       np.histogram(data, bins=fine[::20])[0])
+    with pytest.raises(Exception):
+        decaying.hist(bins=np.linspace(0, 1, 7))
+
+
+def test_RapidSparseHist():
+    rng = np.random.RandomState(9)
+    rsh = RapidSparseHist(maxlen=100, width=0.01, origin=9000)
+    window = deque(maxlen=100)
+    for _ in range(5):
+        data = np.append(rng.normal(9500, 0.05, 40), [np.nan, 1e4])
+        rsh.push(data)
+        window.extend(data)
+        lower_edges, counts = rsh.occupied
+        assert len(counts) <= 100 and np.all(counts > 0)
+        assert counts.sum() == np.isfinite(window).sum()
+        hist, edges = rsh.hist(range=(9499.9, 9500.1))
+        assert edges[0] <= 9499.9 and edges[-1] >= 9500.1
+        assert len(hist) <= 21
+        target, _ = np.histogram(window, bins=edges)
+        assert np.all(hist == target)
+    with pytest.raises(ValueError):
+        rsh.hist()
+    rsh.max_bins = 60000
+    hist, edges = rsh.hist()
+    assert edges[-1] > 1e4 and hist.sum() == np.isfinite(window).sum()
+
+
+def test_RapidSparseHist_full_bin():
+    rsh = RapidSparseHist(maxlen=128, width=1)
+    rsh.push(np.full(128, 0.5))
+    lower_edges, counts = rsh.occupied
+    assert list(counts) == [128]
+    hist, edges = rsh.hist()
+    assert list(hist) == [128] and list(edges) == [0, 1]
+    assert hist.dtype == np.intp
+
+
+def test_RapidTransmissionHist_confidence():
+    edges = np.linspace(0, 1, 5)
+    rth = RapidTransmissionHist(maxlen=400, bins=edges)
+    rth.random_state = np.random.RandomState(2)
+    rng = np.random.RandomState(3)
+    rth.push(rng.uniform(0, 0.75, 400), rng.normal(2, 0.5, 400))
+    lower, upper, resamples, bins = rth.confidence(resamples=300)
+    assert resamples == 300
+    assert np.all(bins == edges)
+    _, mean, _, sem, _ = rth.moments()
+    assert np.all((lower[:3] < mean[:3]) & (mean[:3] < upper[:3]))
+    # A 68% band spans about two standard errors
+    assert np.allclose(upper[:3] - lower[:3], 2 * sem[:3], rtol=0.3)
+    assert np.isnan(lower[3]) and np.isnan(upper[3])
+    # Cached until enough new samples arrive
+    rth.push([0.1], [2])
+    assert rth.confidence(resamples=300)[0] is lower
+    rth.push(np.full(40, 0.1), np.full(40, 2))
+    assert rth.confidence(resamples=300)[0] is not lower
+    rth.bootstrap_batch = len(rth.data)
+    assert rth.confidence(resamples=100, budget=0)[2] == 1
+
+
+def test_HistState_merge_counts():
+    states = []
+    for _ in range(3):
+        rth = RapidTransmissionHist(maxlen=100, bins=[0, 1])
+        rth.push(np.full(100, 0.5), np.ones(100))
+        states.append(rth.state())
+    merged = states[0].merge(states[1]).merge(states[2])
+    assert merged.counts[0] == 300
+    assert merged.moments()[1][0] == 1
@@ -0,0 +1,76 @@
+import logging
+import threading
+import numpy as np
+from auto_monochromator.staging import StagingBuffer
+logger = logging.getLogger(__name__)
+
+
+def test_StagingBuffer_drain():
+    buffer = StagingBuffer(maxlen=10, fields=2)
+    values, timestamps = buffer.drain()
+    assert values.shape == (0,) and timestamps.shape == (0,)
+    for i in range(3):
+        buffer.put(i * 10, i)
+    values, timestamps = buffer.drain()
+    assert np.all(values == [0, 10, 20])
+    assert np.all(timestamps == [0, 1, 2])
+    assert buffer.received == 3
+    assert len(buffer.drain()[0]) == 0
+
+
+def test_StagingBuffer_swap():
+    buffer = StagingBuffer(maxlen=10)
+    buffer.put(1)
+    # A producer still holding the retired deque after the swap
+    retired = buffer._buffers[buffer._active]
+    values, = buffer.drain()
+    retired.append((2,))
+    buffer.put(3)
+    values, = buffer.drain()
+    assert np.all(values == [3])
+    # The straggler is delivered on the swap after next
+    values, = buffer.drain()
+    assert np.all(values == [2])
+
+
+def test_StagingBuffer_dropped(caplog):
+    buffer = StagingBuffer(maxlen=2)
+    for i in range(5):
+        buffer.put(i)
+    assert buffer.dropped == 3
+    with caplog.at_level(logging.WARNING):
+        values, = buffer.drain()
+    assert np.all(values == [0, 1])
+    assert 'Dropped 3 records' in caplog.text
+    caplog.clear()
+    buffer.put(5)
+    with caplog.at_level(logging.WARNING):
+        values, = buffer.drain()
+    assert np.all(values == [5])
+    assert caplog.text == ''
+
+
+def test_StagingBuffer_threaded():
+    count = 100000
+    buffer = StagingBuffer(maxlen=count, fields=2)
+    done = threading.Event()
+
+    def produce():
+        for i in range(count):
+            buffer.put(i, -i)
+        done.set()
+
+    producer = threading.Thread(target=produce)
+    producer.start()
+    drained = []
+    while not done.is_set():
+        drained.append(buffer.drain())
+    producer.join()
+    # Stragglers left in the retired deque come out within two drains
+    drained.append(buffer.drain())
+    drained.append(buffer.drain())
+    values = np.concatenate([values for values, _ in drained])
+    timestamps = np.concatenate([timestamps for _, timestamps in drained])
+    assert buffer.dropped == 0
+    assert np.all(timestamps == -values)
+    assert np.all(np.sort(values) == np.arange(count))